@@ -0,0 +1,485 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from cache import metrics_cache
+from ingest import CACHE_DIR, DIMENSIONS, MEASURE_COLUMNS, dataset_id, dataset_info, iter_dataset, write_cache
+
+
+# Cube columns: Sales is the day's sum, so code written against raw
+# rows (groupby Date / Product, then sum Sales) gives the same totals on it.
+# Cost, Profit and Units are only present when the dataset has them (Profit
+# is derived from Sales - Cost when only Cost is given)
+MEASURES = {
+    'Sales': 'sum', 'Count': 'sum', 'Min': 'min', 'Max': 'max',
+    'Cost': 'sum', 'Profit': 'sum', 'Units': 'sum',
+}
+LEVELS = {'day': 'D', 'week': 'W', 'month': 'M', 'quarter': 'Q'}
+FLUSH_ROWS = 1_000_000  # buffered rows before partial cubes are combined
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+SEGMENTS = tuple(dim for dim in DIMENSIONS if dim != 'Product')
+
+
+def encode_labels(values):
+    """
+    Dictionary-encode a dimension column: a categorical whose sorted
+    categories are the label dictionary, so filters and group-bys work on
+    int codes.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.cat.remove_unused_categories()
+        return values.cat.reorder_categories(sorted(values.cat.categories))
+    return values.astype(pd.CategoricalDtype(sorted(values.dropna().unique())))
+
+
+def _combine(parts, keys):
+    """Merge partial cubes (or one cube at a finer grain) on keys."""
+    parts = [part for part in parts if part is not None and not part.empty]
+    if not parts:
+        return None
+    combined = parts[0] if len(parts) == 1 else pd.concat(parts, ignore_index=True)
+    # Every measure in one grouped pass, however many the dataset has
+    measures = {name: how for name, how in MEASURES.items() if name in combined.columns}
+    return combined.groupby(keys, sort=True, observed=True, dropna=False).agg(measures).reset_index()
+
+
+class DailyRollup:
+    """
+    Mergeable single-pass fold of sales rows into a (date x dims) cube
+    with the sum, count, min and max of Sales per cell, plus the sums of
+    Cost, Profit and Units when the rows have them. Feeding a whole
+    DataFrame as one chunk or a file as many chunks yields the same cube,
+    so memory use is bounded by the chunk size and the number of cells.
+    Dimensions missing from the data are left out of the cube's keys.
+
+    Dimension labels are folded as integer codes into per-dimension
+    dictionaries grown across chunks, so partial cubes are grouped on ints,
+    not strings.
+    """
+
+    def __init__(self, dims=('Product',)):
+        self.dims = tuple(dims)
+        self.keys = None
+        self.cube = None
+        self.dictionaries = {dim: [] for dim in self.dims}  # dim -> code -> label
+        self._codes = {dim: {} for dim in self.dims}        # dim -> label -> code
+        self._parts = []     # rows not yet folded into cube
+        self._pending = 0
+
+    def _encode(self, dim, labels):
+        # Global codes for a chunk's dimension column, -1 where missing (kept
+        # as its own cube row, so totals include rows without a label)
+        codes, dictionary = self._codes[dim], self.dictionaries[dim]
+        if not isinstance(labels.dtype, pd.CategoricalDtype):
+            labels = labels.astype('category')
+        for label in labels.cat.categories:
+            if label not in codes:
+                codes[label] = len(dictionary)
+                dictionary.append(label)
+        # Local code -1 indexes the trailing -1
+        lookup = np.array([codes[label] for label in labels.cat.categories] + [-1], dtype='int64')
+        return lookup[labels.cat.codes.to_numpy()]
+
+    def update(self, chunk):
+        if self.keys is None:
+            self.keys = ['Date'] + [dim for dim in self.dims if dim in chunk.columns]
+        chunk = chunk.dropna(subset=['Date', 'Sales'])
+        if chunk.empty:
+            return self
+        part = chunk.assign(
+            Date=chunk['Date'].dt.normalize(),
+            Count=1,
+            Min=chunk['Sales'],
+            Max=chunk['Sales'],
+        )
+        if 'Cost' in part.columns and 'Profit' not in part.columns:
+            part['Profit'] = part['Sales'] - part['Cost']
+        for dim in self.keys[1:]:
+            part[dim] = self._encode(dim, part[dim])
+        self._parts.append(part[self.keys + [name for name in MEASURES if name in part.columns]])
+        self._pending += len(part)
+        # Re-group once the buffered rows outgrow the cube, so the cube is
+        # not regrouped for every chunk
+        if self._pending >= max(len(self.cube) if self.cube is not None else 0, FLUSH_ROWS):
+            self._flush()
+        return self
+
+    def _flush(self):
+        if self._parts:
+            self.cube = _combine([self.cube] + self._parts, self.keys)
+            self._parts = []
+            self._pending = 0
+
+    def merge(self, other):
+        """Fold in another partial cube, translating its dimension codes."""
+        self.keys = self.keys or other.keys
+        self._flush()
+        other._flush()
+        cube = other.cube
+        if cube is not None:
+            cube = cube.assign(**{
+                dim: self._encode(dim, pd.Series(
+                    pd.Categorical.from_codes(cube[dim], categories=other.dictionaries[dim])
+                ))
+                for dim in self.keys[1:]
+            })
+        self.cube = _combine([self.cube, cube], self.keys)
+        return self
+
+    def to_frame(self):
+        self._flush()
+        if self.cube is not None:
+            cube = self.cube.astype({'Count': 'int64'})
+            for dim in self.keys[1:]:
+                cube[dim] = encode_labels(
+                    pd.Series(pd.Categorical.from_codes(cube[dim], categories=self.dictionaries[dim]))
+                )
+            return cube
+        columns = {'Date': pd.Series(dtype='datetime64[ns]')}
+        for dim in (self.keys or [])[1:]:
+            columns[dim] = pd.Series(dtype=pd.CategoricalDtype([]))
+        columns.update({
+            'Sales': pd.Series(dtype='float64'),
+            'Count': pd.Series(dtype='int64'),
+            'Min': pd.Series(dtype='float64'),
+            'Max': pd.Series(dtype='float64'),
+        })
+        return pd.DataFrame(columns)
+
+
+def rollup_path_for(cache_path):
+    return os.path.join(CACHE_DIR, f"{dataset_id(cache_path)}.rollup.parquet")
+
+
+def segment_path_for(cache_path):
+    return os.path.join(CACHE_DIR, f"{dataset_id(cache_path)}.segments.parquet")
+
+
+def build_cubes(cache_path):
+    """
+    Build the stored cubes of a cached dataset in one streaming pass: the
+    daily cube by product and the daily cube by segment (Category, Region,
+    Channel). Datasets are immutable, so this runs once each. Returns
+    (rollup path, segment path); raises ValueError if Date or Sales is missing.
+    """
+    paths = {rollup_path_for(cache_path): ('Product',), segment_path_for(cache_path): SEGMENTS}
+    folds = {path: DailyRollup(dims) for path, dims in paths.items() if not os.path.exists(path)}
+    if folds:
+        columns = dataset_info(cache_path)[0]
+        for col in ('Date', 'Sales'):
+            if col not in columns:
+                raise ValueError(f"Missing required column: {col}")
+        dims = {dim for fold in folds.values() for dim in fold.dims}
+        wanted = ['Date', 'Sales'] + [dim for dim in DIMENSIONS if dim in dims and dim in columns]
+        wanted += [name for name in MEASURE_COLUMNS if name in columns]
+        for chunk in iter_dataset(cache_path, columns=wanted):
+            for fold in folds.values():
+                fold.update(chunk)
+        for path, fold in folds.items():
+            write_cache([fold.to_frame()], path)
+    return tuple(paths)
+
+
+def build_rollup(cache_path):
+    """Build the stored cubes of a dataset (see build_cubes); returns the product cube's path."""
+    return build_cubes(cache_path)[0]
+
+
+def _read_cube(cube_path):
+    cube = pd.read_parquet(cube_path)
+    for dim in DIMENSIONS:
+        if dim in cube.columns:
+            # The stored dictionary may be split per row group; restore one sorted one
+            cube[dim] = encode_labels(cube[dim])
+    return cube
+
+
+def load_rollup(cache_path):
+    """
+    The daily (date x product) cube of a dataset, built on first use.
+    Product is a categorical over the dataset's product dictionary.
+    """
+    rollup_path = build_rollup(cache_path)
+    return metrics_cache.get_or_compute(("rollup", rollup_path), lambda: _read_cube(rollup_path))
+
+
+def load_segments(cache_path):
+    """
+    The daily (date x Category x Region x Channel) cube of a dataset, built
+    on first use; segment columns the dataset lacks are left out.
+    """
+    segment_path = build_cubes(cache_path)[1]
+    return metrics_cache.get_or_compute(("segments", segment_path), lambda: _read_cube(segment_path))
+
+
+def calendar_grids(cube):
+    """
+    Daily sales totals binned into two dense calendar grids:
+    'month' is (months x 31 days of month) and 'week' is (weeks x 7
+    weekdays, Monday first). Rows are labelled by month / week start dates.
+    Days without sales inside the data range are 0; cells outside it, or
+    that do not exist (e.g. 30 Feb), are NaN.
+    """
+    daily = rollup(cube, 'day').set_index('Date')['Sales']
+    if daily.empty:
+        empty = np.empty(0, dtype='datetime64[ns]')
+        return {'month_starts': empty, 'month': np.empty((0, 31)), 'week_starts': empty, 'week': np.empty((0, 7))}
+    days = pd.date_range(daily.index.min(), daily.index.max(), freq='D')
+    values = daily.reindex(days, fill_value=0.0).to_numpy()
+
+    month_starts = pd.date_range(days[0].to_period('M').start_time, days[-1], freq='MS')
+    month_rows = (days.year - days[0].year) * 12 + days.month - days[0].month
+    month = np.full((len(month_starts), 31), np.nan)
+    month[month_rows, days.day - 1] = values
+
+    first_week = days[0] - pd.Timedelta(days=days[0].weekday())
+    week_rows = (days - first_week).days // 7
+    week_starts = pd.date_range(first_week, days[-1], freq='7D')
+    week = np.full((len(week_starts), 7), np.nan)
+    week[week_rows, days.weekday] = values
+
+    return {
+        'month_starts': month_starts.to_numpy(),
+        'month': month,
+        'week_starts': week_starts.to_numpy(),
+        'week': week,
+    }
+
+
+def calendar_path_for(cache_path):
+    return os.path.join(CACHE_DIR, f"{dataset_id(cache_path)}.calendar.npz")
+
+
+def _save_npz(path, arrays):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def _read_npz(path):
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def build_calendar(cache_path):
+    """Compute and store a dataset's calendar grids; returns their path."""
+    calendar_path = calendar_path_for(cache_path)
+    if not os.path.exists(calendar_path):
+        _save_npz(calendar_path, calendar_grids(load_rollup(cache_path)))
+    return calendar_path
+
+
+def load_calendar(cache_path):
+    """The calendar grids of a dataset (see calendar_grids), built on first use."""
+    calendar_path = build_calendar(cache_path)
+    return metrics_cache.get_or_compute(("calendar", calendar_path), lambda: _read_npz(calendar_path))
+
+
+def slice_calendar(calendar, start=None, end=None):
+    """
+    Calendar grids cut to the rows overlapping [start, end], with cells
+    outside the range blanked. Rows are found by binary search.
+    """
+    sliced = {}
+    for level, width in (('month', 31), ('week', 7)):
+        starts = calendar[f'{level}_starts']
+        lo = starts.searchsorted(_day(start), 'right') - 1 if start is not None else 0
+        hi = starts.searchsorted(_day(end), 'right') if end is not None else len(starts)
+        starts, grid = starts[max(lo, 0):hi], calendar[level][max(lo, 0):hi].copy()
+        cell_days = starts[:, None] + np.arange(width)[None, :] * np.timedelta64(1, 'D')
+        if start is not None:
+            grid[cell_days < _day(start)] = np.nan
+        if end is not None:
+            grid[cell_days > _day(end)] = np.nan
+        sliced[f'{level}_starts'], sliced[level] = starts, grid
+    return sliced
+
+
+def calendar_cells(calendar, level='month'):
+    """
+    One row per grid cell for charting: 'month' gives Month / Day columns,
+    'week' gives Week / Weekday. Empty cells are dropped; the cell count
+    depends only on the date range, never on the number of transactions.
+    """
+    grid = calendar[level]
+    starts = np.repeat(calendar[f'{level}_starts'], grid.shape[1])
+    if level == 'month':
+        cells = pd.DataFrame({'Month': starts, 'Day': np.tile(np.arange(1, 32), len(grid))})
+    else:
+        cells = pd.DataFrame({'Week': starts, 'Weekday': np.tile(WEEKDAYS, len(grid))})
+    cells['Sales'] = grid.ravel()
+    return cells.dropna(subset=['Sales']).reset_index(drop=True)
+
+
+def products_of(cube):
+    """Sorted product labels of a cube, read from its product dictionary."""
+    if 'Product' not in cube.columns:
+        return []
+    return cube['Product'].cat.categories.tolist()
+
+
+def period_starts(dates, level='month'):
+    """
+    Start date of the 'day' / 'week' / 'month' / 'quarter' period of each
+    date. Cubes hold few distinct dates, so only those are converted.
+    """
+    codes, days = pd.factorize(dates)
+    starts = pd.DatetimeIndex(days).to_period(LEVELS[level]).start_time
+    return pd.Series(starts.take(codes, fill_value=pd.NaT), index=dates.index) if len(codes) else dates
+
+
+def rollup(cube, level='month', by_product=False, product=None):
+    """
+    Re-aggregate the daily cube to 'day', 'week', 'month' or 'quarter'.
+    Periods are labelled by their start date. product restricts the cube to
+    one product; by_product keeps products apart instead of summing them.
+    """
+    if product is not None:
+        cube = cube[cube['Product'] == product]
+    periods = period_starts(cube['Date'], level)
+    keys = ['Date', 'Product'] if by_product and 'Product' in cube.columns else ['Date']
+    frame = cube.assign(Date=periods)[keys + [name for name in MEASURES if name in cube.columns]]
+    result = _combine([frame], keys)
+    return result if result is not None else frame.iloc[0:0]
+
+
+def _day(value):
+    return np.datetime64(pd.Timestamp(value).normalize(), 'ns')
+
+
+class DateIndex:
+    """
+    Sorted days of a dataset with prefix sums of daily sales, row counts
+    and, when the dataset has them, cost, profit and units.
+
+    A date range is located with two binary searches, and its totals are
+    differences of prefix sums, so range KPIs cost O(log days) whatever the
+    number of rows or the width of the range. All measures share one
+    prefix-sum matrix, so adding measures adds columns, not passes.
+    """
+
+    def __init__(self, days, sales, counts, cost=None, profit=None, units=None):
+        self.days = np.asarray(days, dtype='datetime64[ns]')
+        self.sales = np.asarray(sales, dtype='float64')
+        self.counts = np.asarray(counts, dtype='int64')
+        optional = {'Cost': cost, 'Profit': profit, 'Units': units}
+        self.measures = {'Sales': self.sales, 'Count': self.counts}
+        self.measures.update({
+            name: np.asarray(values, dtype='float64') for name, values in optional.items() if values is not None
+        })
+        matrix = np.column_stack([values.astype('float64') for values in self.measures.values()])
+        self.cumulative = np.vstack([np.zeros((1, matrix.shape[1])), np.cumsum(matrix, axis=0)])
+
+    @classmethod
+    def from_cube(cls, cube):
+        daily = rollup(cube, 'day')
+        optional = {name.lower(): daily[name].to_numpy() for name in MEASURE_COLUMNS if name in daily.columns}
+        return cls(daily['Date'].to_numpy(), daily['Sales'].to_numpy(), daily['Count'].to_numpy(), **optional)
+
+    def to_arrays(self):
+        arrays = {'days': self.days, 'sales': self.sales, 'counts': self.counts}
+        arrays.update({name.lower(): self.measures[name] for name in MEASURE_COLUMNS if name in self.measures})
+        return arrays
+
+    def bounds(self):
+        """(first day, last day) with sales, or (None, None) if empty."""
+        if not len(self.days):
+            return None, None
+        return pd.Timestamp(self.days[0]), pd.Timestamp(self.days[-1])
+
+    def span(self, start=None, end=None):
+        """Positions [lo, hi) of the days within [start, end]."""
+        lo = self.days.searchsorted(_day(start), 'left') if start is not None else 0
+        hi = self.days.searchsorted(_day(end), 'right') if end is not None else len(self.days)
+        return lo, max(lo, hi)
+
+    def kpis(self, start=None, end=None):
+        """
+        Total, per-row average, latest day and day-over-day growth of sales
+        for a range, plus total cost, profit, units and the profit margin
+        when the dataset has them.
+        """
+        lo, hi = self.span(start, end)
+        # One row subtraction gives the range total of every measure
+        totals = dict(zip(self.measures, self.cumulative[hi] - self.cumulative[lo]))
+        total_sales, count = totals['Sales'], totals['Count']
+        avg_sales = total_sales / count if count else np.nan
+        latest_sales = self.sales[hi - 1] if hi > lo else 0
+        previous = self.sales[hi - 2] if hi - lo > 1 else None
+        growth = (latest_sales - previous) / previous * 100 if previous else 0
+        kpis = {
+            "total_sales": round(total_sales, 2),
+            "avg_sales": round(avg_sales, 2),
+            "latest_sales": round(latest_sales, 2),
+            "growth": round(growth, 2),
+        }
+        for name in MEASURE_COLUMNS:
+            if name in totals:
+                kpis[f"total_{name.lower()}"] = round(totals[name], 2)
+        if 'Profit' in totals:
+            kpis["margin"] = round(totals['Profit'] / total_sales * 100, 2) if total_sales else 0
+        return kpis
+
+
+def date_index_path_for(cache_path):
+    return os.path.join(CACHE_DIR, f"{dataset_id(cache_path)}.dates.npz")
+
+
+def build_date_index(cache_path):
+    """Compute and store a dataset's DateIndex; returns its path."""
+    index_path = date_index_path_for(cache_path)
+    if not os.path.exists(index_path):
+        _save_npz(index_path, DateIndex.from_cube(load_rollup(cache_path)).to_arrays())
+    return index_path
+
+
+def load_date_index(cache_path):
+    """The DateIndex of a dataset, built on first use."""
+    index_path = build_date_index(cache_path)
+    return metrics_cache.get_or_compute(
+        ("dates", index_path), lambda: DateIndex(**_read_npz(index_path))
+    )
+
+
+def slice_cube(cube, start=None, end=None):
+    """Rows of a cube within [start, end]; the cube is sorted by date, so this is a binary search."""
+    dates = cube['Date'].to_numpy()
+    lo = dates.searchsorted(_day(start), 'left') if start is not None else 0
+    hi = dates.searchsorted(_day(end), 'right') if end is not None else len(dates)
+    return cube.iloc[lo:hi]
+
+
+def add_margin(frame):
+    """frame with a Margin column (profit as % of sales) when it has Profit."""
+    if 'Profit' not in frame.columns:
+        return frame
+    return frame.assign(Margin=frame['Profit'] / frame['Sales'].where(frame['Sales'] != 0) * 100)
+
+
+def dataset_metrics(cube, date_index, start=None, end=None):
+    """
+    Dashboard metrics for [start, end] (the whole dataset by default): KPIs
+    from the date index, monthly trend and top products from the cube slice.
+    Cost, Profit, Units and Margin are included when the dataset has them.
+    """
+    metrics = date_index.kpis(start, end)
+    cube = slice_cube(cube, start, end)
+    sums = ['Sales'] + [name for name in MEASURE_COLUMNS if name in cube.columns]
+
+    # Sales trend over time (monthly aggregation)
+    metrics["sales_trend"] = add_margin(rollup(cube, 'month')[['Date'] + sums])
+
+    # Top products by sales (if Product column exists), every measure in one group-by
+    if 'Product' in cube.columns:
+        metrics["top_products"] = add_margin(
+            cube.groupby('Product', observed=True)[sums].sum()
+            .sort_values('Sales', ascending=False)
+            .head(5)
+            .reset_index()
+        )
+    else:
+        metrics["top_products"] = None
+    return metrics
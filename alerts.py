@@ -0,0 +1,167 @@
+import os
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from aggregates import load_date_index, load_rollup, slice_cube
+from cache import metrics_cache
+from forecasting import ALL_PRODUCTS, daily_series, product_matrix
+from ingest import CACHE_DIR, dataset_id, write_cache
+
+
+ZSCORE_WINDOW = 28       # trailing days a day's sales are scored against
+ZSCORE_THRESHOLD = 3.0   # |z| at or above this is a spike / drop
+EVAL_DAYS = 7            # latest days checked for spikes and drops
+WOW_THRESHOLD_PCT = 30   # week-over-week change at or beyond this is an alert
+TREND_WINDOW = 28        # days per slope when looking for a trend break
+TREND_MIN_CHANGE = 0.1   # slope over a window, as a share of its mean level
+MIN_DAILY_SALES = 1.0    # baselines below this per day are too thin to alert on
+
+# Only the latest days are scanned, so the cost of an upload's alerts
+# depends on the number of products, not on the length of the history
+LOOKBACK_DAYS = max(ZSCORE_WINDOW + EVAL_DAYS, 14, 2 * TREND_WINDOW)
+ALERT_COLUMNS = ['Product', 'Date', 'Alert', 'Value', 'Severity', 'Message']
+
+
+def _zscore_alerts(matrix, dates):
+    # Each of the last EVAL_DAYS days against the ZSCORE_WINDOW days before it
+    values = matrix[:, -EVAL_DAYS:]
+    windows = sliding_window_view(matrix[:, -(EVAL_DAYS + ZSCORE_WINDOW):-1], ZSCORE_WINDOW, axis=1)
+    mean, std = windows.mean(axis=2), windows.std(axis=2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.where((std > 0) & (mean >= MIN_DAILY_SALES), (values - mean) / std, 0.0)
+    rows, cols = np.nonzero(np.abs(z) >= ZSCORE_THRESHOLD)
+    z = z[rows, cols]
+    return {
+        'row': rows,
+        'Date': dates[-EVAL_DAYS:][cols],
+        'Alert': np.where(z > 0, 'Spike', 'Drop'),
+        'Value': z,
+        'Severity': np.abs(z) / ZSCORE_THRESHOLD,
+    }
+
+
+def _week_over_week_alerts(matrix, dates):
+    recent, previous = matrix[:, -7:].sum(axis=1), matrix[:, -14:-7].sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = np.where(previous >= 7 * MIN_DAILY_SALES, (recent - previous) / previous * 100, 0.0)
+    rows = np.nonzero(np.abs(change) >= WOW_THRESHOLD_PCT)[0]
+    change = change[rows]
+    return {
+        'row': rows,
+        'Date': np.repeat(dates[-1], len(rows)),
+        'Alert': np.where(change > 0, 'Week-over-week rise', 'Week-over-week fall'),
+        'Value': change,
+        'Severity': np.abs(change) / WOW_THRESHOLD_PCT,
+    }
+
+
+def _slopes(windows):
+    # Least-squares slope of every row at once: centred x times centred y
+    x = np.arange(windows.shape[1]) - (windows.shape[1] - 1) / 2
+    return (windows - windows.mean(axis=1, keepdims=True)) @ x / (x ** 2).sum()
+
+
+def _trend_break_alerts(matrix, dates):
+    previous, recent = matrix[:, -2 * TREND_WINDOW:-TREND_WINDOW], matrix[:, -TREND_WINDOW:]
+    level = matrix[:, -2 * TREND_WINDOW:].mean(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Change over each window as a share of the level, e.g. 0.2 = +20%
+        before = np.where(level >= MIN_DAILY_SALES, _slopes(previous) * TREND_WINDOW / level, 0.0)
+        after = np.where(level >= MIN_DAILY_SALES, _slopes(recent) * TREND_WINDOW / level, 0.0)
+    broken = (
+        (np.sign(before) != np.sign(after))
+        & (np.abs(before) >= TREND_MIN_CHANGE)
+        & (np.abs(after) >= TREND_MIN_CHANGE)
+    )
+    rows = np.nonzero(broken)[0]
+    after = after[rows]
+    return {
+        'row': rows,
+        'Date': np.repeat(dates[-1], len(rows)),
+        'Alert': np.where(after > 0, 'Trend turned up', 'Trend turned down'),
+        'Value': after * 100,
+        'Severity': np.minimum(np.abs(before[rows]), np.abs(after)) / TREND_MIN_CHANGE,
+    }
+
+
+def _message(alert):
+    name, value = alert['Product'], alert['Value']
+    if alert['Alert'] in ('Spike', 'Drop'):
+        return f"{name}: {alert['Alert'].lower()} on {alert['Date']:%b %d} ({value:+.1f}σ vs the previous {ZSCORE_WINDOW} days)"
+    if alert['Alert'].startswith('Week-over-week'):
+        return f"{name}: last 7 days {value:+.0f}% vs the week before"
+    direction = "up" if value > 0 else "down"
+    return f"{name}: trend turned {direction} ({value:+.0f}% over the last {TREND_WINDOW} days, reversing the prior {TREND_WINDOW})"
+
+
+def detect_alerts(products, dates, matrix, total=None):
+    """
+    Alerts for every row of a (product x day) sales matrix at once, plus
+    the all-products total (daily totals, matrix column sums by default):
+
+    - Spike / Drop: a day among the last EVAL_DAYS whose rolling z-score
+      against the ZSCORE_WINDOW days before it reaches ZSCORE_THRESHOLD
+    - Week-over-week rise / fall: the last 7 days vs the 7 before
+    - Trend turned up / down: the slope of the last TREND_WINDOW days has
+      the opposite sign to the slope of the window before it
+
+    Detectors needing more days than the matrix has are skipped. Returns a
+    DataFrame of ALERT_COLUMNS, most severe first.
+    """
+    total = matrix.sum(axis=0) if total is None else np.asarray(total, dtype='float64')
+    matrix = np.vstack([matrix, total[None, :]])
+    labels = np.asarray(list(products) + [ALL_PRODUCTS], dtype=object)
+    dates = np.asarray(dates, dtype='datetime64[ns]')
+
+    detectors = [
+        (_zscore_alerts, EVAL_DAYS + ZSCORE_WINDOW),
+        (_week_over_week_alerts, 14),
+        (_trend_break_alerts, 2 * TREND_WINDOW),
+    ]
+    found = [detect(matrix, dates) for detect, days in detectors if matrix.shape[1] >= days]
+    found = [pd.DataFrame(columns) for columns in found if len(columns['row'])]
+    if not found:
+        return pd.DataFrame({col: pd.Series(dtype='object') for col in ALERT_COLUMNS})
+
+    alerts = pd.concat(found, ignore_index=True)
+    alerts.insert(0, 'Product', labels[alerts.pop('row').to_numpy()])
+    alerts['Message'] = [_message(alert) for alert in alerts.to_dict('records')]
+    return alerts.sort_values('Severity', ascending=False, ignore_index=True)[ALERT_COLUMNS]
+
+
+def alerts_path_for(cache_path):
+    return os.path.join(CACHE_DIR, f"{dataset_id(cache_path)}.alerts.parquet")
+
+
+def build_alerts(cache_path):
+    """
+    Compute and store the alerts of a dataset's latest LOOKBACK_DAYS days,
+    from its daily cube; returns their path. Datasets are immutable, so this
+    runs once per upload.
+    """
+    alerts_path = alerts_path_for(cache_path)
+    if os.path.exists(alerts_path):
+        return alerts_path
+    first_day, last_day = load_date_index(cache_path).bounds()
+    if last_day is None:
+        products, dates, matrix, total = [], pd.DatetimeIndex([]), np.zeros((0, 0)), np.zeros(0)
+    else:
+        start = max(first_day, last_day - pd.Timedelta(days=LOOKBACK_DAYS - 1))
+        cube = slice_cube(load_rollup(cache_path), start, last_day)
+        # Totals from the cube, so rows without a product still count
+        total = daily_series(cube, start, last_day)
+        dates = total.index
+        if 'Product' in cube.columns:
+            products, dates, matrix = product_matrix(cube, start, last_day)
+        else:
+            products, matrix = [], np.zeros((0, len(dates)))
+    write_cache([detect_alerts(products, dates, matrix, total)], alerts_path)
+    return alerts_path
+
+
+def load_alerts(cache_path):
+    """A dataset's stored alerts (see detect_alerts), built on first use."""
+    alerts_path = build_alerts(cache_path)
+    return metrics_cache.get_or_compute(("alerts", alerts_path), lambda: pd.read_parquet(alerts_path))
@@ -0,0 +1,98 @@
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def estimate_size(value):
+    """
+    Rough in-memory footprint of a cached value in bytes.
+    DataFrames/Series are measured deeply; containers are walked recursively.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(value, pd.DataFrame) else int(usage)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            estimate_size(k) + estimate_size(v) for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+
+class ByteLRUCache:
+    """
+    Thread-safe LRU cache that evicts by total estimated size in bytes
+    rather than by entry count. Shared by every session in the process.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        size = estimate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            # Values larger than the whole budget are never cached
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute, should_cache=None):
+        """Return the cached value for key, computing and storing it on a miss."""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is not sentinel:
+            return value
+        value = compute()
+        if should_cache is None or should_cache(value):
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Process-wide cache for dashboard metrics, keyed by dataset fingerprint
+METRICS_CACHE_BYTES = 256 * 1024 * 1024
+metrics_cache = ByteLRUCache(METRICS_CACHE_BYTES)
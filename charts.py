@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+
+# Points per series sent to the browser: more than a line chart can show,
+# and few enough that the Vega-Lite spec stays small for any history length
+MAX_POINTS = 500
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: indices of n_out points of (x, y) that
+    keep the visual shape of the series, including its peaks and troughs.
+    The first and last points are always kept. x must be sorted.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    # Inner points split into n_out - 2 buckets of near-equal size
+    edges = np.linspace(1, n - 1, n_out - 1).astype('int64')
+    keep = np.empty(n_out, dtype='int64')
+    keep[0], keep[-1] = 0, n - 1
+
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # Next bucket's average is the triangle's third corner
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        area = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(area.argmax())
+        keep[i + 1] = previous
+    return keep
+
+
+def downsample(df, x, y, n_out=MAX_POINTS, by=None):
+    """
+    Rows of df reduced to at most n_out points per series along column y (by
+    x), with LTTB. With by, each group of that column is its own series.
+    Datetime x columns are supported. Short series are returned as is.
+    """
+    if by is not None:
+        groups = [downsample(group, x, y, n_out) for _, group in df.groupby(by, observed=True, sort=False)]
+        return pd.concat(groups) if groups else df
+    if len(df) <= n_out:
+        return df
+    df = df.sort_values(x)
+    xs = df[x]
+    if pd.api.types.is_datetime64_any_dtype(xs):
+        xs = xs.astype('int64')
+    values = df[y].fillna(0)
+    return df.iloc[lttb(xs.to_numpy(), values.to_numpy(), n_out)]
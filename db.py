@@ -1,10 +1,21 @@
 from sqlalchemy import create_engine, text
+import json
+import os
 import re
+import threading
+import time
 
 
 DB_PATH = "users.db"
 engine = create_engine(f"sqlite:///{DB_PATH}", echo=False)
 
+# Stored forecasts and other derived data live apart from the users table,
+# in an untracked file under tmp/ that can be deleted at any time
+CACHE_DB_PATH = os.path.join("tmp", "cache.db")
+cache_engine = create_engine(f"sqlite:///{CACHE_DB_PATH}", echo=False)
+_created = set()
+_created_lock = threading.Lock()
+
 def is_valid_email(email):
     """
     Check if the provided email is valid.
@@ -46,4 +57,106 @@ def get_user(email, password):
             text("SELECT * FROM users WHERE email=:e AND password=:p"),
             {"e": email, "p": password}
         ).fetchone()
-        return result
\ No newline at end of file
+        return result
+
+
+def _ensure_table(create_table):
+    """Run a create_*_table function once per process, on first use"""
+    with _created_lock:
+        if create_table not in _created:
+            os.makedirs(os.path.dirname(CACHE_DB_PATH), exist_ok=True)
+            create_table()
+            _created.add(create_table)
+
+def create_forecasts_table():
+    with cache_engine.connect() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS forecasts(
+                dataset_id TEXT NOT NULL,
+                product TEXT NOT NULL,
+                engine TEXT NOT NULL,
+                horizon INTEGER NOT NULL,
+                forecast TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (dataset_id, product, engine)
+            )
+        """))
+        conn.commit()
+
+def save_forecasts(dataset_id, engine_version, forecasts):
+    """Store {product: values} for a dataset, replacing older entries"""
+    _ensure_table(create_forecasts_table)
+    rows = [
+        {"d": dataset_id, "p": product, "e": engine_version,
+         "h": len(values), "f": json.dumps([float(v) for v in values])}
+        for product, values in forecasts.items()
+    ]
+    if not rows:
+        return
+    with cache_engine.connect() as conn:
+        conn.execute(
+            text("INSERT OR REPLACE INTO forecasts (dataset_id, product, engine, horizon, forecast) "
+                 "VALUES (:d, :p, :e, :h, :f)"),
+            rows
+        )
+        conn.commit()
+
+def get_forecast(dataset_id, product, engine_version, horizon):
+    """Stored forecast sliced to horizon, or None if none covers it"""
+    _ensure_table(create_forecasts_table)
+    with cache_engine.connect() as conn:
+        result = conn.execute(
+            text("SELECT forecast FROM forecasts WHERE dataset_id=:d AND product=:p "
+                 "AND engine=:e AND horizon>=:h"),
+            {"d": dataset_id, "p": product, "e": engine_version, "h": horizon}
+        ).fetchone()
+    if result is None:
+        return None
+    return json.loads(result[0])[:horizon]
+
+def has_forecasts(dataset_id, engine_version, product=None):
+    """Whether any forecast (or the one for product) is stored for a dataset"""
+    _ensure_table(create_forecasts_table)
+    query = "SELECT 1 FROM forecasts WHERE dataset_id=:d AND engine=:e"
+    params = {"d": dataset_id, "e": engine_version}
+    if product is not None:
+        query += " AND product=:p"
+        params["p"] = product
+    with cache_engine.connect() as conn:
+        result = conn.execute(text(query + " LIMIT 1"), params).fetchone()
+    return result is not None
+
+def create_llm_cache_table():
+    with cache_engine.connect() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS llm_responses(
+                prompt_hash TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """))
+        conn.commit()
+
+def get_llm_response(prompt_hash, max_age):
+    """Cached response for a prompt hash if younger than max_age seconds"""
+    _ensure_table(create_llm_cache_table)
+    with cache_engine.connect() as conn:
+        result = conn.execute(
+            text("SELECT response FROM llm_responses WHERE prompt_hash=:h AND created_at>=:t"),
+            {"h": prompt_hash, "t": time.time() - max_age}
+        ).fetchone()
+    return result[0] if result else None
+
+def save_llm_response(prompt_hash, model, response, max_age):
+    """Store a response and drop entries older than max_age seconds"""
+    _ensure_table(create_llm_cache_table)
+    now = time.time()
+    with cache_engine.connect() as conn:
+        conn.execute(
+            text("INSERT OR REPLACE INTO llm_responses (prompt_hash, model, response, created_at) "
+                 "VALUES (:h, :m, :r, :t)"),
+            {"h": prompt_hash, "m": model, "r": response, "t": now}
+        )
+        conn.execute(text("DELETE FROM llm_responses WHERE created_at<:t"), {"t": now - max_age})
+        conn.commit()
@@ -0,0 +1,136 @@
+import pandas as pd
+
+from aggregates import LEVELS, MEASURES, SEGMENTS, DailyRollup, add_margin, load_rollup, load_segments, period_starts, slice_cube
+from cache import metrics_cache
+from ingest import DIMENSIONS, MEASURE_COLUMNS, dataset_id, dataset_info, iter_dataset
+
+
+# Drill-down metrics: the cube measures plus two derived from them
+METRICS = ('Sales', 'Count', 'Average', 'Min', 'Max', 'Cost', 'Profit', 'Units', 'Margin')
+DERIVED = {'Average': ('Sales', 'Count'), 'Margin': ('Profit', 'Sales')}
+
+
+def available_dimensions(cache_path):
+    """Dimension columns (Product, Category, Region, Channel) a dataset has."""
+    columns = dataset_info(cache_path)[0]
+    return [dim for dim in DIMENSIONS if dim in columns]
+
+
+def available_metrics(cache_path):
+    """Metrics a dataset supports: Cost, Profit, Units and Margin need their columns."""
+    columns = set(dataset_info(cache_path)[0])
+    if 'Cost' in columns:
+        columns.add('Profit')  # derived from Sales - Cost
+    present = {'Sales', 'Count', 'Average', 'Min', 'Max'} | (columns & set(MEASURE_COLUMNS))
+    if 'Profit' in present:
+        present.add('Margin')
+    return [metric for metric in METRICS if metric in present]
+
+
+def _cube_for(cache_path, dims):
+    """
+    The stored cube keyed by every dimension in dims: the segment cube
+    (Category, Region, Channel), which is the smaller one, or else the
+    product cube. None when no stored cube holds the combination.
+    """
+    if set(dims) <= set(SEGMENTS):
+        return load_segments(cache_path)
+    if set(dims) <= {'Product'}:
+        return load_rollup(cache_path)
+    return None
+
+
+def _fold_rows(cache_path, filters, dims, grain, start, end):
+    """
+    Cube for a combination no stored cube holds (e.g. Product with Region),
+    folded from raw rows that pass the filters and date range, at the query's
+    grain (months when it has none) so it stays as small as its answer.
+    """
+    fold = DailyRollup(dims)
+    columns = dataset_info(cache_path)[0]
+    measures = [name for name in MEASURE_COLUMNS if name in columns]
+    for chunk in iter_dataset(cache_path, columns=['Date', 'Sales'] + list(dims) + measures):
+        mask = chunk['Date'].notna()
+        if start is not None:
+            mask &= chunk['Date'] >= pd.Timestamp(start).normalize()
+        if end is not None:
+            mask &= chunk['Date'] < pd.Timestamp(end).normalize() + pd.Timedelta(days=1)
+        for dim, values in filters.items():
+            mask &= chunk[dim].isin(values)
+        chunk = chunk[mask]
+        fold.update(chunk.assign(Date=period_starts(chunk['Date'], grain or 'month')))
+    return fold.to_frame()
+
+
+def dimension_values(cache_path, dim):
+    """Sorted labels of one dimension, read from a cube's dictionary."""
+    return _cube_for(cache_path, {dim})[dim].cat.categories.tolist()
+
+
+def _as_filters(filters):
+    # {dim: label or labels} -> {dim: (labels, ...)}, hashable for the memo key
+    normalized = {}
+    for dim, values in (filters or {}).items():
+        if isinstance(values, str) or not hasattr(values, '__iter__'):
+            values = [values]
+        normalized[dim] = tuple(sorted(values, key=str))
+    return normalized
+
+
+def _run_query(cache_path, filters, group_by, metric, grain, start, end):
+    dims = set(group_by) | set(filters)
+    cube = _cube_for(cache_path, dims)
+    if cube is None:
+        cube = _fold_rows(cache_path, filters, sorted(dims), grain, start, end)
+    else:
+        cube = slice_cube(cube, start, end)
+        for dim, values in filters.items():
+            cube = cube[cube[dim].isin(values)]
+
+    keys = list(group_by)
+    if grain is not None:
+        cube = cube.assign(Date=period_starts(cube['Date'], grain))
+        keys = ['Date'] + keys
+    # Only the measures the metric is built from are aggregated
+    measures = {name: MEASURES[name] for name in DERIVED.get(metric, (metric,))}
+    if keys:
+        result = cube.groupby(keys, sort=True, observed=True, dropna=False).agg(measures).reset_index()
+    else:
+        result = pd.DataFrame({name: [cube[name].agg(how)] for name, how in measures.items()})
+    if metric == 'Average':
+        result['Average'] = result['Sales'] / result['Count']
+    elif metric == 'Margin':
+        result = add_margin(result)
+    return result[keys + [metric]]
+
+
+def query(cache_path, filters=None, group_by=(), metric='Sales', grain=None, start=None, end=None):
+    """
+    Drill-down query: metric per combination of the group_by dimensions, and
+    per period when grain is 'day', 'week', 'month' or 'quarter' (periods
+    are labelled by their start date in a Date column). filters maps a
+    dimension to the label or labels to keep; start / end bound the dates.
+
+    Answers come from the pre-aggregated cubes; raw rows are scanned only
+    when no cube holds the requested dimensions. Results are memoized per
+    dataset.
+    Raises ValueError for an unknown dimension, metric or grain.
+    """
+    filters = _as_filters(filters)
+    group_by = tuple(group_by)
+    dims = available_dimensions(cache_path)
+    for dim in set(group_by) | set(filters):
+        if dim not in dims:
+            raise ValueError(f"Unknown dimension: {dim}")
+    if metric not in available_metrics(cache_path):
+        raise ValueError(f"Unknown metric: {metric}")
+    if grain is not None and grain not in LEVELS:
+        raise ValueError(f"Unknown time grain: {grain}")
+
+    key = (
+        "query", dataset_id(cache_path), tuple(sorted(filters.items())), group_by, metric, grain,
+        None if start is None else pd.Timestamp(start), None if end is None else pd.Timestamp(end),
+    )
+    return metrics_cache.get_or_compute(
+        key, lambda: _run_query(cache_path, filters, group_by, metric, grain, start, end)
+    )
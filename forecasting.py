@@ -0,0 +1,198 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from aggregates import load_rollup
+from db import has_forecasts, save_forecasts
+from ingest import dataset_id
+
+
+SEASON_LENGTH = 7      # weekly seasonality on daily data
+FIT_WINDOW = 365       # most recent days used to fit the model
+DAMPING = 0.98         # damped trend keeps long horizons from running away
+
+# Smoothing parameters are chosen per series from this grid by one-step SSE
+ALPHAS = (0.1, 0.3, 0.6)
+BETAS = (0.01, 0.1, 0.3)
+GAMMAS = (0.05, 0.2, 0.5)
+
+MAX_HORIZON = 90       # longest horizon offered; shorter ones are prefixes
+ENGINE_VERSION = "holt-winters:v1"  # bump when results change, to skip stale stored forecasts
+ALL_PRODUCTS = "All Products"
+# Stored (with no values) once a batch run has saved every product; single
+# products saved on demand do not mark the batch as done
+BATCH_COMPLETE = "__batch_complete__"
+
+
+def daily_series(df, start=None, end=None):
+    """
+    Total sales per calendar day, with days without sales filled as 0.
+    start / end extend or trim the series to a fixed date range. df is raw
+    rows or the daily rollup cube, whose Sales column holds daily sums.
+    """
+    df = df.dropna(subset=['Date', 'Sales'])
+    if df.empty and (start is None or end is None):
+        return pd.Series(dtype='float64', index=pd.DatetimeIndex([], name='Date'), name='Sales')
+    daily = df.groupby(df['Date'].dt.normalize())['Sales'].sum()
+    dates = pd.date_range(
+        start if start is not None else daily.index.min(),
+        end if end is not None else daily.index.max(),
+        freq='D', name='Date',
+    )
+    return daily.reindex(dates, fill_value=0.0)
+
+
+def product_matrix(df, start, end):
+    """
+    Pivot sales into a dense (product x day) matrix over [start, end].
+    Returns (sorted product labels, daily DatetimeIndex, 2-D float array).
+    """
+    dates = pd.date_range(start, end, freq='D', name='Date')
+    df = df.dropna(subset=['Date', 'Sales', 'Product'])
+    days = df['Date'].dt.normalize()
+    df = df[(days >= dates[0]) & (days <= dates[-1])]
+    days = days[df.index]
+
+    if isinstance(df['Product'].dtype, pd.CategoricalDtype):
+        # Dictionary-encoded: the codes already index the product dictionary
+        codes, products = df['Product'].cat.codes.to_numpy('int64'), df['Product'].cat.categories
+    else:
+        codes, products = pd.factorize(df['Product'], sort=True)
+    day_idx = (days - dates[0]).dt.days.to_numpy()
+    flat = codes * len(dates) + day_idx
+    matrix = np.bincount(
+        flat, weights=df['Sales'].to_numpy(dtype='float64'),
+        minlength=len(products) * len(dates),
+    ).reshape(len(products), len(dates))
+    return products, dates, matrix
+
+
+def _param_grid():
+    alpha, beta, gamma = np.meshgrid(ALPHAS, BETAS, GAMMAS, indexing='ij')
+    return alpha.ravel(), beta.ravel(), gamma.ravel()
+
+
+def holt_winters(y, horizon, season_length=SEASON_LENGTH):
+    """
+    Additive Holt-Winters with a damped trend.
+
+    y is one series (n,) or a stack of aligned series (series, n). The
+    recursion steps through time once, updating every series and every
+    smoothing-parameter candidate together as NumPy arrays; the best
+    candidate per series is the one with the lowest one-step-ahead SSE.
+    Returns forecasts of shape (horizon,) or (series, horizon).
+    """
+    y = np.asarray(y, dtype='float64')
+    single = y.ndim == 1
+    y = np.nan_to_num(np.atleast_2d(y)[:, -FIT_WINDOW:])
+    n_series, n = y.shape
+    if n == 0:
+        forecast = np.zeros((n_series, horizon))
+        return forecast[0] if single else forecast
+
+    # Too little history for a seasonal profile: fall back to damped Holt
+    m = season_length if n >= 2 * season_length else 1
+    if m > 1:
+        level0 = y[:, :m].mean(axis=1)
+        trend0 = (y[:, m:2 * m].mean(axis=1) - level0) / m
+        season0 = y[:, :m] - level0[:, None]
+    else:
+        level0 = y[:, 0]
+        trend0 = y[:, 1] - y[:, 0] if n > 1 else np.zeros(n_series)
+        season0 = np.zeros((n_series, 1))
+
+    alpha, beta, gamma = _param_grid()
+    candidates = alpha.size
+    level = np.repeat(level0[:, None], candidates, axis=1)
+    trend = np.repeat(trend0[:, None], candidates, axis=1)
+    season = np.repeat(season0[:, None, :], candidates, axis=1)
+    sse = np.zeros((n_series, candidates))
+
+    for t in range(n):
+        idx = t % m
+        observed = y[:, t, None]
+        seasonal = season[:, :, idx]
+        damped = level + DAMPING * trend
+        error = observed - (damped + seasonal)
+        sse += error * error
+        new_level = alpha * (observed - seasonal) + (1 - alpha) * damped
+        trend = beta * (new_level - level) + (1 - beta) * DAMPING * trend
+        season[:, :, idx] = gamma * (observed - new_level) + (1 - gamma) * seasonal
+        level = new_level
+
+    rows = np.arange(n_series)
+    best = sse.argmin(axis=1)
+    level, trend, season = level[rows, best], trend[rows, best], season[rows, best]
+
+    steps = np.arange(1, horizon + 1)
+    damping = np.cumsum(DAMPING ** steps)
+    forecast = (
+        level[:, None]
+        + trend[:, None] * damping[None, :]
+        + season[:, (n + steps - 1) % m]
+    )
+    # Sales cannot go negative
+    forecast = np.maximum(forecast, 0.0)
+    return forecast[0] if single else forecast
+
+
+def forecast_all_products(df, horizon=MAX_HORIZON):
+    """
+    Forecast every product, plus the all-products total, in one vectorized
+    Holt-Winters pass over the (product x day) matrix.
+
+    Returns a DataFrame indexed by product (ALL_PRODUCTS first) whose columns
+    are the forecast dates. Each product is fitted on the dataset-wide date
+    range, matching daily_series(product_df, start, end) for a single product.
+    """
+    dates = df['Date'].dropna()
+    if dates.empty:
+        return pd.DataFrame()
+    end = dates.max().normalize()
+    # Only the last FIT_WINDOW days feed the model, so the pivot stops there
+    start = max(dates.min().normalize(), end - pd.Timedelta(days=FIT_WINDOW - 1))
+
+    labels = [ALL_PRODUCTS]
+    series = [daily_series(df, start, end).to_numpy()]
+    if 'Product' in df.columns:
+        products, _, matrix = product_matrix(df, start, end)
+        labels += list(products)
+        series.append(matrix)
+
+    forecasts = holt_winters(np.vstack(series), horizon)
+    forecast_dates = pd.date_range(end + pd.Timedelta(days=1), periods=horizon, freq='D')
+    return pd.DataFrame(forecasts, index=pd.Index(labels, name='Product'), columns=forecast_dates)
+
+
+# ---- Background batch forecasts, one job per dataset per process ----
+_batch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batch-forecast")
+_batch_jobs = {}
+_batch_lock = threading.Lock()
+
+
+def _run_batch_forecast(dataset_path):
+    key = dataset_id(dataset_path)
+    if has_forecasts(key, ENGINE_VERSION, BATCH_COMPLETE):
+        return
+    # The daily cube has one row per (day, product), far fewer than the raw rows
+    forecasts = forecast_all_products(load_rollup(dataset_path))
+    stored = {product: values for product, values in zip(forecasts.index, forecasts.to_numpy())}
+    # Written with the forecasts, in one transaction; horizon 0 is never served
+    stored[BATCH_COMPLETE] = []
+    save_forecasts(key, ENGINE_VERSION, stored)
+
+
+def start_batch_forecast(dataset_path):
+    """
+    Queue the all-products forecast for a dataset if it is not already queued.
+    Results land in the forecasts table, read back with db.get_forecast.
+    """
+    with _batch_lock:
+        job = _batch_jobs.get(dataset_path)
+        # A finished job whose results are gone from the table runs again
+        if job is None or (job.done() and not has_forecasts(dataset_id(dataset_path), ENGINE_VERSION, BATCH_COMPLETE)):
+            job = _batch_executor.submit(_run_batch_forecast, dataset_path)
+            _batch_jobs[dataset_path] = job
+    return job
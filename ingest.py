@@ -0,0 +1,416 @@
+import hashlib
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import load_workbook
+
+
+UPLOAD_DIR = "tmp"
+CACHE_DIR = os.path.join(UPLOAD_DIR, "cache")
+
+# Rows parsed / scanned per chunk; bounds peak memory for files larger than RAM
+CHUNK_ROWS = 500_000
+
+# Date formats the upload page accepts, in order of preference; the one
+# that parses most of a sampled column is used for the whole column
+DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%Y', '%Y-%m-%d %H:%M:%S', '%m/%d/%Y %H:%M')
+DATE_SAMPLE_ROWS = 1000
+
+MERGE_VERSION = "merge:v2"  # bump when merged output changes
+
+# Low-cardinality text columns, read back dictionary-encoded (pandas categoricals)
+DIMENSIONS = ('Product', 'Category', 'Region', 'Channel')
+
+# Optional numeric columns for profitability analysis, typed like Sales.
+# Headers are matched in any case, including these common variants
+MEASURE_COLUMNS = {
+    'Cost': ('cost', 'cogs', 'total cost', 'cost of goods sold'),
+    'Profit': ('profit', 'gross profit', 'net profit'),
+    'Units': ('units', 'units sold', 'quantity', 'qty'),
+}
+NUMERIC_COLUMNS = ('Sales',) + tuple(MEASURE_COLUMNS)
+
+
+def content_hash(data):
+    """Return the SHA-256 hex digest of an in-memory buffer."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(file_path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file, read in fixed-size chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_fingerprint(file_path):
+    """
+    Cheap identity for a file on disk: path, modification time and size.
+    Raises FileNotFoundError if the file does not exist.
+    """
+    stat = os.stat(file_path)
+    return (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+
+
+def cache_path_for(digest):
+    return os.path.join(CACHE_DIR, f"{digest}.parquet")
+
+
+def dataset_id(cache_path):
+    """The content hash a cached dataset is stored under."""
+    return os.path.splitext(os.path.basename(cache_path))[0]
+
+
+def _format_hits(sample, date_format):
+    return pd.to_datetime(sample, format=date_format, errors='coerce').notna().sum()
+
+
+def parse_dates(values):
+    """
+    Parse a text date column with an explicit, vectorized format.
+
+    Each distinct string is parsed once. The format is detected from a
+    sample among DATE_FORMATS; strings it cannot parse are retried with the
+    other formats, and only what is still left falls back to pandas'
+    per-element inference. Values that are already datetimes (e.g. from
+    XLSX cells) pass through unchanged.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques)
+    if uniques.empty:
+        return pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+
+    text = uniques if pd.api.types.is_string_dtype(uniques) else uniques.astype(str)
+    sample = text.sample(min(len(text), DATE_SAMPLE_ROWS), random_state=0)
+    formats = sorted(DATE_FORMATS, key=lambda fmt: -_format_hits(sample, fmt))
+
+    parsed = pd.to_datetime(text, format=formats[0], errors='coerce')
+    for date_format in formats[1:] + [None]:
+        failed = parsed.isna()
+        if not failed.any():
+            break
+        if date_format is None:
+            retry = pd.to_datetime(uniques[failed], errors='coerce', format='mixed')
+        else:
+            retry = pd.to_datetime(text[failed], format=date_format, errors='coerce')
+        parsed[failed] = retry
+
+    # Missing values have code -1, which picks the trailing NaT
+    lookup = np.append(parsed.to_numpy(dtype='datetime64[ns]'), np.datetime64('NaT', 'ns'))
+    return pd.Series(lookup[codes], index=values.index)
+
+
+def _measure_name(column):
+    """Canonical name of an optional measure column header, else the header itself."""
+    key = str(column).strip().lower()
+    for name, variants in MEASURE_COLUMNS.items():
+        if key in variants:
+            return name
+    return column
+
+
+def apply_types(df):
+    """
+    Apply the column types every page expects: parsed dates and numeric
+    Sales, Cost, Profit and Units. Measure headers are renamed to their
+    canonical names. Unparseable values become NaT / NaN so downstream
+    dropna() still works. This is the only place dates are parsed; cached
+    datasets store them typed.
+    """
+    renames = {}
+    for col in df.columns:
+        name = _measure_name(col)
+        if name != col and name not in df.columns and name not in renames.values():
+            renames[col] = name
+    if renames:
+        df = df.rename(columns=renames)
+    if 'Date' in df.columns:
+        df['Date'] = parse_dates(df['Date'])
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns:
+            # Always float so chunks with and without gaps share one schema
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+    return df
+
+
+def _csv_chunks(file_path, chunk_rows, progress):
+    total_bytes = os.path.getsize(file_path) or 1
+    with open(file_path, "rb") as f:
+        for chunk in pd.read_csv(f, dtype=str, chunksize=chunk_rows):
+            if progress:
+                progress(min(f.tell() / total_bytes, 1.0))
+            yield chunk
+
+
+def _xlsx_frame(rows, columns):
+    width = len(columns)
+    rows = [tuple(row[:width]) + (None,) * (width - len(row)) for row in rows]
+    df = pd.DataFrame(rows, columns=columns, dtype=object)
+    # Match the CSV path: everything except the typed columns is text
+    for col in df.columns:
+        if col != 'Date' and _measure_name(col) not in NUMERIC_COLUMNS:
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+def _xlsx_chunks(file_path, chunk_rows, progress):
+    """
+    Stream the first worksheet row by row in read-only mode, so the workbook
+    object model is never built in memory.
+    """
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        total_rows = max((sheet.max_row or 1) - 1, 1)
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [
+            str(name) if name is not None else f"Unnamed: {i}"
+            for i, name in enumerate(header)
+        ]
+
+        buffer = []
+        done = 0
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            buffer.append(row)
+            if len(buffer) >= chunk_rows:
+                done += len(buffer)
+                yield _xlsx_frame(buffer, columns)
+                buffer = []
+                if progress:
+                    progress(min(done / total_rows, 1.0))
+        if buffer:
+            yield _xlsx_frame(buffer, columns)
+        if progress:
+            progress(1.0)
+    finally:
+        workbook.close()
+
+
+def iter_source_chunks(file_path, chunk_rows=CHUNK_ROWS, progress=None):
+    """
+    Yield typed chunks of a raw CSV or XLSX file. Columns are read as text and
+    only the known columns are converted, so every chunk shares one schema.
+    progress, if given, is called with the fraction of the file processed.
+    """
+    if file_path.lower().endswith(".xlsx"):
+        chunks = _xlsx_chunks(file_path, chunk_rows, progress)
+    else:
+        chunks = _csv_chunks(file_path, chunk_rows, progress)
+    for chunk in chunks:
+        yield apply_types(chunk)
+
+
+def _string_for_null(schema):
+    # An all-empty text column in the first chunk is inferred as null type
+    return pa.schema([
+        field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+        for field in schema
+    ], metadata=schema.metadata)
+
+
+def write_cache(chunks, cache_path, schema=None):
+    """
+    Stream typed chunks (DataFrames or Arrow tables) into a Parquet file and
+    move it into place atomically. Only one chunk is held in memory at a time.
+    Without an explicit schema, the first chunk's schema is used for all.
+    """
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    writer = None
+    try:
+        for chunk in chunks:
+            if writer is None:
+                if schema is None:
+                    table = pa.Table.from_pandas(chunk, preserve_index=False)
+                    schema = _string_for_null(table.schema)
+                writer = pq.ParquetWriter(tmp_path, schema)
+            if isinstance(chunk, pa.Table):
+                table = chunk.cast(schema)
+            else:
+                table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        raise ValueError("No data found in file")
+    os.replace(tmp_path, cache_path)
+
+
+def ingest_file(file_path, digest=None, progress=None):
+    """
+    Convert a raw file into the typed Parquet cache, keyed by content hash.
+    The file is only parsed the first time its contents are seen.
+    Returns the path of the cached Parquet file.
+    """
+    digest = digest or file_hash(file_path)
+    cache_path = cache_path_for(digest)
+    if not os.path.exists(cache_path):
+        write_cache(iter_source_chunks(file_path, progress=progress), cache_path)
+    return cache_path
+
+
+def _save_upload(file_name, data):
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    save_path = os.path.join(UPLOAD_DIR, file_name)
+    with open(save_path, "wb") as f:
+        f.write(data)
+    return save_path
+
+
+def ingest_uploads(uploads, max_workers=None, progress=None):
+    """
+    Ingest uploaded (file name, buffer) pairs and merge them into one dataset.
+
+    Files already in the cache are skipped; the rest are parsed in parallel
+    in a process pool. progress, if given, is called as progress(file name,
+    fraction done): per chunk for a single file, per finished file in the pool.
+    Files without data rows are left out and reported as errors.
+    Returns (dataset path or None, {file name: error}).
+    """
+    cache_paths = {}
+    pending = {}
+    errors = {}
+    for index, (file_name, data) in enumerate(uploads):
+        digest = content_hash(data)
+        cache_path = cache_path_for(digest)
+        if os.path.exists(cache_path):
+            cache_paths[index] = cache_path
+        else:
+            pending[index] = (_save_upload(file_name, data), digest)
+
+    if len(pending) > 1:
+        workers = min(len(pending), max_workers or os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                index: pool.submit(ingest_file, save_path, digest)
+                for index, (save_path, digest) in pending.items()
+            }
+            for done, (index, future) in enumerate(futures.items(), start=1):
+                file_name = uploads[index][0]
+                try:
+                    cache_paths[index] = future.result()
+                except Exception as e:
+                    errors[file_name] = str(e)
+                if progress:
+                    progress(file_name, done / len(futures))
+    else:
+        for index, (save_path, digest) in pending.items():
+            file_name = uploads[index][0]
+            report = (lambda fraction: progress(file_name, fraction)) if progress else None
+            try:
+                cache_paths[index] = ingest_file(save_path, digest, progress=report)
+            except Exception as e:
+                errors[file_name] = str(e)
+
+    # Header-only files have nothing to merge; they are reported instead
+    for index in sorted(cache_paths):
+        if dataset_info(cache_paths[index])[1] == 0:
+            errors[uploads[index][0]] = "No data rows found in file"
+            del cache_paths[index]
+
+    ordered = [cache_paths[index] for index in sorted(cache_paths)]
+    if not ordered:
+        return None, errors
+    return merge_datasets(ordered), errors
+
+
+def _unified_schema(cache_paths):
+    """
+    Union of the columns of several cached datasets. Columns missing from a
+    file are filled with nulls; differing types are promoted where possible.
+    """
+    schemas = [pq.read_schema(path).remove_metadata() for path in cache_paths]
+    return pa.unify_schemas(schemas, promote_options="permissive")
+
+
+def _conform(table, schema):
+    columns = [
+        table.column(field.name) if field.name in table.column_names
+        else pa.nulls(table.num_rows, type=field.type)
+        for field in schema
+    ]
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def _iter_merged(cache_paths, schema):
+    # 64-bit row hashes of the files already written, kept sorted for lookup.
+    # A file's rows are only matched against earlier files: exports without
+    # a transaction ID legitimately repeat rows within one file
+    seen = np.empty(0, dtype=np.uint64)
+    for path in cache_paths:
+        file_hashes = []
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=CHUNK_ROWS):
+            table = _conform(pa.Table.from_batches([batch]), schema)
+            hashes = pd.util.hash_pandas_object(table.to_pandas(), index=False).to_numpy()
+            file_hashes.append(hashes)
+            keep = ~np.isin(hashes, seen)
+            if not keep.any():
+                continue
+            yield table if keep.all() else table.filter(pa.array(keep))
+        if file_hashes:
+            seen = np.union1d(seen, np.concatenate(file_hashes))
+
+
+def merge_datasets(cache_paths):
+    """
+    Merge cached datasets into one, reconciling their schemas and dropping
+    rows of a file that already appear in an earlier file; repeats within
+    one file are kept. The merged dataset is cached under a hash of its
+    inputs, so the same set of files merges only once.
+    """
+    cache_paths = list(dict.fromkeys(cache_paths))
+    if len(cache_paths) == 1:
+        return cache_paths[0]
+
+    digests = [dataset_id(path) for path in cache_paths]
+    # Versioned so merges cached under an older de-duplication rule are not reused
+    merged_path = cache_path_for(content_hash("\n".join([MERGE_VERSION] + digests).encode()))
+    if not os.path.exists(merged_path):
+        schema = _unified_schema(cache_paths)
+        write_cache(_iter_merged(cache_paths, schema), merged_path, schema=schema)
+    return merged_path
+
+
+def _dictionary_columns(cache_path):
+    names = pq.read_schema(cache_path).names
+    return [col for col in DIMENSIONS if col in names]
+
+
+def load_dataset(cache_path, columns=None):
+    """
+    Load a cached dataset with its dtypes already applied. Dimension columns
+    come back as categoricals: integer codes plus one copy of each label.
+    """
+    table = pq.read_table(cache_path, columns=columns, read_dictionary=_dictionary_columns(cache_path))
+    return table.to_pandas()
+
+
+def dataset_info(cache_path):
+    """Return (column names, row count) of a cached dataset from its metadata."""
+    parquet_file = pq.ParquetFile(cache_path)
+    return parquet_file.schema_arrow.names, parquet_file.metadata.num_rows
+
+
+def iter_dataset(cache_path, columns=None, chunk_rows=CHUNK_ROWS):
+    """
+    Yield a cached dataset as DataFrame chunks without loading it whole.
+    Dimension columns are categoricals, with categories local to each chunk.
+    """
+    parquet_file = pq.ParquetFile(cache_path, read_dictionary=_dictionary_columns(cache_path))
+    for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=columns):
+        yield batch.to_pandas()
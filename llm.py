@@ -0,0 +1,504 @@
+import hashlib
+import os
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+
+import httpx
+from dotenv import load_dotenv
+from groq import APIConnectionError, APIStatusError, DefaultHttpxClient, Groq
+
+from db import get_llm_response, save_llm_response
+
+load_dotenv()
+
+
+MODEL = "llama-3.3-70b-versatile"
+CACHE_TTL_SECONDS = 24 * 60 * 60
+
+# Total time budget per request, retries included; callers stop waiting after this
+DEADLINE_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "20"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+# Latency target for interactive pages: past it they serve a local result and
+# keep waiting (up to DEADLINE_SECONDS) for the LLM answer to replace it
+SLO_SECONDS = float(os.getenv("LLM_SLO_SECONDS", "5"))
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_CAP_SECONDS = 8.0
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Process-wide admission control for upstream calls
+MAX_CONCURRENT = int(os.getenv("LLM_MAX_CONCURRENT", "4"))
+REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "30"))
+BURST = int(os.getenv("LLM_BURST", "5"))
+
+_client = None
+_client_lock = threading.Lock()
+
+# Requests run here so independent calls overlap with each other and the UI.
+# Sized well above MAX_CONCURRENT: queueing and fairness are left to the
+# admission controller rather than this pool's FIFO
+_executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="llm")
+
+# Identical prompts being sent right now share one upstream call
+_inflight = {}   # prompt key -> Future of a complete() call
+_streams = {}    # prompt key -> _StreamFanout of a stream() call
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "coalesced": 0, "errors": 0}
+_ttft_seconds = deque(maxlen=500)  # recent time-to-first-token of streamed calls
+
+
+def get_client():
+    """
+    The process-wide Groq client, or None when GROQ_API_KEY is not set.
+    It is built once and keeps a pool of keep-alive connections, so reruns
+    and sessions reuse open TLS connections. Retries are done by
+    create_completion, not by the SDK.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            api_key = os.getenv("GROQ_API_KEY")
+            if not api_key:
+                return None
+            _client = Groq(
+                api_key=api_key,
+                max_retries=0,
+                timeout=DEADLINE_SECONDS,
+                http_client=DefaultHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=32,
+                        max_keepalive_connections=16,
+                        keepalive_expiry=120,
+                    )
+                ),
+            )
+        return _client
+
+
+def _retry_delay(error, attempt):
+    # Honour the server's Retry-After on 429s, otherwise full-jitter backoff
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        if retry_after is not None:
+            return float(retry_after)
+    except ValueError:
+        pass
+    return random.uniform(0, min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def create_completion(client, model, messages, timeout=DEADLINE_SECONDS, **options):
+    """
+    chat.completions.create with bounded, jittered retries on 429/5xx and
+    connection errors. timeout is the budget for all attempts together;
+    TimeoutError is raised once it is spent.
+    """
+    deadline = time.monotonic() + timeout
+    for attempt in range(MAX_RETRIES + 1):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"LLM request exceeded its {timeout:.0f}s budget")
+        try:
+            return client.chat.completions.create(
+                model=model, messages=messages, timeout=remaining, **options
+            )
+        except APIStatusError as e:
+            if e.status_code not in RETRYABLE_STATUS or attempt == MAX_RETRIES:
+                raise
+            error = e
+        except APIConnectionError as e:
+            if attempt == MAX_RETRIES:
+                raise
+            error = e
+        delay = _retry_delay(error, attempt)
+        if time.monotonic() + delay >= deadline:
+            raise error
+        time.sleep(delay)
+
+
+class AdmissionController:
+    """
+    Gate for upstream LLM calls shared by every session in the process.
+
+    A call is admitted when a concurrency slot is free and the token bucket
+    (rate_per_second, up to burst tokens) has a token. Waiting calls are
+    queued per user and served round-robin across users, so one user's burst
+    cannot starve everyone else.
+    """
+
+    def __init__(self, max_concurrent, rate_per_second, burst):
+        self.max_concurrent = max_concurrent
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self._cond = threading.Condition()
+        self._queues = OrderedDict()  # user -> deque of waiting tickets, in serving order
+        self._active = 0
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate_per_second)
+        self._refilled_at = now
+
+    def _schedule(self):
+        # Round-robin order: every user's first ticket, then every second ticket, ...
+        queues = [list(queue) for queue in self._queues.values()]
+        order = []
+        depth = 0
+        while any(len(queue) > depth for queue in queues):
+            order.extend(queue[depth] for queue in queues if len(queue) > depth)
+            depth += 1
+        return order
+
+    def _remove(self, user, ticket):
+        queue = self._queues[user]
+        queue.remove(ticket)
+        if queue:
+            # The user just had a turn, so they go to the back of the rotation
+            self._queues.move_to_end(user)
+        else:
+            del self._queues[user]
+
+    def acquire(self, user, timeout=None):
+        """Block until admitted; raises TimeoutError after timeout seconds."""
+        ticket = object()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            self._queues.setdefault(user, deque()).append(ticket)
+            while True:
+                self._refill()
+                if (self._schedule()[0] is ticket
+                        and self._active < self.max_concurrent
+                        and self._tokens >= 1):
+                    self._remove(user, ticket)
+                    self._active += 1
+                    self._tokens -= 1
+                    self._cond.notify_all()
+                    return
+
+                wait = None
+                if self._tokens < 1:
+                    wait = (1 - self._tokens) / self.rate_per_second
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._remove(user, ticket)
+                        self._cond.notify_all()
+                        raise TimeoutError("Timed out waiting in the LLM request queue")
+                    wait = remaining if wait is None else min(wait, remaining)
+                self._cond.wait(wait)
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, user, timeout=None):
+        self.acquire(user, timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def position(self, user):
+        """1-based queue position of the user's next waiting call, 0 if none is waiting."""
+        with self._cond:
+            for index, ticket in enumerate(self._schedule(), start=1):
+                if ticket in self._queues.get(user, ()):
+                    return index
+        return 0
+
+    def stats(self):
+        with self._cond:
+            self._refill()
+            return {
+                "active": self._active,
+                "waiting": sum(len(queue) for queue in self._queues.values()),
+                "tokens": round(self._tokens, 2),
+            }
+
+
+admission = AdmissionController(MAX_CONCURRENT, REQUESTS_PER_MINUTE / 60, BURST)
+
+
+def queue_position(user):
+    return admission.position(user)
+
+
+def normalize_prompt(prompt):
+    """Collapse indentation and whitespace so cosmetic differences share a cache key."""
+    return " ".join(prompt.split())
+
+
+def prompt_key(model, prompt):
+    return hashlib.sha256(f"{model}\n{normalize_prompt(prompt)}".encode()).hexdigest()
+
+
+def _count(stat):
+    with _lock:
+        _stats[stat] += 1
+
+
+def complete(client, prompt, model=MODEL, ttl=CACHE_TTL_SECONDS, timeout=DEADLINE_SECONDS, user=None,
+             json_mode=False, refresh=False, queue_timeout=None):
+    """
+    Text of a chat completion for a single user prompt.
+
+    Responses are cached in SQLite for ttl seconds, keyed by model and
+    normalized prompt. Concurrent callers with the same prompt wait on the
+    first caller's request instead of issuing their own. Errors are not
+    cached and are raised to every waiting caller. timeout, in seconds,
+    is the budget for the upstream request including queueing and retries,
+    unless queue_timeout is given: then the wait for admission has its own
+    budget and timeout starts once admitted. user identifies the caller's
+    queue in the admission controller.
+    json_mode asks the API for a JSON object; refresh skips the cache read,
+    e.g. to retry a response that failed validation.
+    """
+    started = time.monotonic()
+    key = prompt_key(f"{model}:json" if json_mode else model, prompt)
+    cached = None if refresh else get_llm_response(key, ttl)
+    if cached is not None:
+        _count("hits")
+        return cached
+
+    with _lock:
+        future = _inflight.get(key)
+        owner = future is None
+        if owner:
+            future = Future()
+            _inflight[key] = future
+
+    if not owner:
+        _count("coalesced")
+        return future.result()
+
+    try:
+        # Another caller may have finished between the lookup and taking ownership
+        text = None if refresh else get_llm_response(key, ttl)
+        if text is not None:
+            _count("hits")
+        else:
+            _count("misses")
+            with admission.slot(user, timeout=timeout if queue_timeout is None else queue_timeout):
+                remaining = timeout if queue_timeout is not None else timeout - (time.monotonic() - started)
+                options = {"response_format": {"type": "json_object"}} if json_mode else {}
+                response = create_completion(
+                    client, model, [{"role": "user", "content": prompt}], timeout=remaining, **options
+                )
+            text = response.choices[0].message.content
+            save_llm_response(key, model, text, ttl)
+        future.set_result(text)
+        return text
+    except Exception as e:
+        _count("errors")
+        future.set_exception(e)
+        raise
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+
+
+def submit(client, prompt, model=MODEL, timeout=DEADLINE_SECONDS, user=None, json_mode=False, refresh=False,
+           queue_timeout=None):
+    """
+    Start complete() in the background and return its Future.
+    Wait with future.result(timeout=...) to apply a deadline; a request that
+    finishes after its caller gave up is still cached for the next one.
+    """
+    return _executor.submit(
+        complete, client, prompt, model, CACHE_TTL_SECONDS, timeout, user,
+        json_mode=json_mode, refresh=refresh, queue_timeout=queue_timeout,
+    )
+
+
+class TokenStream:
+    """
+    Text deltas of a streamed completion, produced by a background thread.
+
+    started is a Future that resolves at the first token, so callers can show
+    queue status until text begins to arrive. Iterating yields deltas as they
+    come and raises TimeoutError if none arrives within idle_timeout seconds.
+    """
+
+    _DONE = object()
+
+    def __init__(self, idle_timeout):
+        self.started = Future()
+        self.idle_timeout = idle_timeout
+        self._queue = queue.Queue()
+
+    def put(self, delta):
+        if not self.started.done():
+            self.started.set_result(True)
+        self._queue.put(delta)
+
+    def finish(self):
+        if not self.started.done():
+            self.started.set_result(True)
+        self._queue.put(self._DONE)
+
+    def fail(self, error):
+        if not self.started.done():
+            self.started.set_exception(error)
+        self._queue.put(error)
+
+    def __iter__(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                raise TimeoutError(f"No tokens received for {self.idle_timeout:.0f}s")
+            if item is self._DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+class _StreamFanout:
+    """
+    One upstream stream shared by every TokenStream asking for the same
+    prompt. Deltas are kept, so a subscriber joining late first gets the
+    text so far, then the rest as it arrives.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._parts = []
+        self._subscribers = []
+        self._outcome = None  # TokenStream method name and args once ended
+
+    def subscribe(self, token_stream):
+        with self._lock:
+            if self._parts:
+                token_stream.put("".join(self._parts))
+            if self._outcome is not None:
+                name, args = self._outcome
+                getattr(token_stream, name)(*args)
+            else:
+                self._subscribers.append(token_stream)
+
+    def put(self, delta):
+        with self._lock:
+            self._parts.append(delta)
+            for token_stream in self._subscribers:
+                token_stream.put(delta)
+
+    def _end(self, name, *args):
+        with self._lock:
+            self._outcome = (name, args)
+            for token_stream in self._subscribers:
+                getattr(token_stream, name)(*args)
+            self._subscribers = []
+
+    def finish(self):
+        self._end("finish")
+
+    def fail(self, error):
+        self._end("fail", error)
+
+
+def _run_stream(client, prompt, model, ttl, timeout, user, token_stream):
+    started = time.monotonic()
+    key = prompt_key(model, prompt)
+    cached = get_llm_response(key, ttl)
+    if cached is not None:
+        _count("hits")
+        token_stream.put(cached)
+        token_stream.finish()
+        return
+
+    # Concurrent streams of the same prompt subscribe to the first one
+    with _lock:
+        fanout = _streams.get(key)
+        owner = fanout is None
+        if owner:
+            fanout = _StreamFanout()
+            _streams[key] = fanout
+        pending = _inflight.get(key) if owner else None
+    fanout.subscribe(token_stream)
+    if not owner:
+        _count("coalesced")
+        return
+
+    try:
+        # Another caller may have finished between the lookup and taking ownership
+        text = get_llm_response(key, ttl)
+        if text is None and pending is not None:
+            # A complete() call for the same prompt is already upstream
+            _count("coalesced")
+            text = pending.result()
+        if text is not None:
+            fanout.put(text)
+            fanout.finish()
+            return
+
+        _count("misses")
+        parts = []
+        with admission.slot(user, timeout=timeout):
+            remaining = timeout - (time.monotonic() - started)
+            response = create_completion(
+                client, model, [{"role": "user", "content": prompt}],
+                timeout=remaining, stream=True
+            )
+            for chunk in response:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                if not parts:
+                    with _lock:
+                        _ttft_seconds.append(time.monotonic() - started)
+                parts.append(delta)
+                fanout.put(delta)
+
+        save_llm_response(key, model, "".join(parts), ttl)
+        fanout.finish()
+    except Exception as e:
+        _count("errors")
+        fanout.fail(e)
+    finally:
+        with _lock:
+            _streams.pop(key, None)
+
+
+def stream(client, prompt, model=MODEL, timeout=DEADLINE_SECONDS, user=None):
+    """
+    Start a streamed completion in the background and return its TokenStream.
+    Cache hits arrive as a single delta; finished streams are cached like
+    complete(). Concurrent streams of the same prompt share one upstream
+    call: later ones get the text so far, then the rest live. timeout bounds queueing plus time to first token, and the
+    gap between later tokens.
+    """
+    token_stream = TokenStream(idle_timeout=timeout)
+    _executor.submit(_run_stream, client, prompt, model, CACHE_TTL_SECONDS, timeout, user, token_stream)
+    return token_stream
+
+
+def ttft_stats():
+    """Time-to-first-token percentiles (seconds) over recent streamed calls."""
+    with _lock:
+        samples = sorted(_ttft_seconds)
+    if not samples:
+        return {"count": 0, "p50": None, "p95": None}
+    return {
+        "count": len(samples),
+        "p50": round(samples[len(samples) // 2], 3),
+        "p95": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+    }
+
+
+def cache_stats():
+    """Hit / miss / coalesced counters for this process, with the hit rate."""
+    with _lock:
+        stats = dict(_stats)
+    served = stats["hits"] + stats["coalesced"]
+    lookups = served + stats["misses"]
+    stats["hit_rate"] = round(served / lookups, 4) if lookups else 0.0
+    return stats
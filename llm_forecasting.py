@@ -0,0 +1,222 @@
+import json
+import math
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from db import save_forecasts
+from forecasting import MAX_HORIZON
+from llm import DEADLINE_SECONDS, MODEL, admission, submit
+from prompts import build_forecast_prompt
+
+
+ENGINE_VERSION = f"{MODEL}:v3"  # bump when prompts or post-processing change
+BATCH_SIZE = 10          # products per request
+MAX_ATTEMPTS = 2         # first request plus one retry for products that failed
+MIN_VALID_FRACTION = 0.5  # share of numeric values a series needs to be repaired
+MAX_CHANGE = 0.3         # forecasts are kept within +-30% of the recent level
+SMOOTHING_WINDOW = 5
+QUEUE_SECONDS = 300      # longest a paced batch waits for admission
+
+# Whole-catalogue runs, one per dataset per process, polled by pages
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+# Whole batch runs, so pages can wait on them with a deadline
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="llm-forecast")
+
+
+def _extract_json(text):
+    """Parse the JSON object in a response, tolerating code fences and trailing commas."""
+    text = re.sub(r"```(?:json)?", "", text)
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        raise ValueError("No JSON object in response")
+    body = text[start:end + 1]
+    try:
+        return json.loads(body)
+    except json.JSONDecodeError:
+        return json.loads(re.sub(r",\s*([\]}])", r"\1", body))
+
+
+def _as_number(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def repair_series(values, horizon):
+    """
+    Coerce one product's answer into exactly horizon non-negative floats.
+    Non-numeric entries are dropped, short answers are padded with the last
+    value and long ones truncated. Returns None when too little is usable.
+    """
+    if not isinstance(values, list):
+        return None
+    numbers = [number for number in map(_as_number, values) if number is not None]
+    if len(numbers) < max(1, MIN_VALID_FRACTION * horizon):
+        return None
+    numbers = [max(number, 0.0) for number in numbers[:horizon]]
+    return numbers + [numbers[-1]] * (horizon - len(numbers))
+
+
+def stabilize(values, daily):
+    """Limit a forecast to +-MAX_CHANGE of the last week's mean and smooth it."""
+    values = np.asarray(values, dtype='float64')
+    recent = float(daily.tail(7).mean()) if len(daily) else 0.0
+    if recent > 0:
+        values = np.clip(values, recent * (1 - MAX_CHANGE), recent * (1 + MAX_CHANGE))
+    # Centred moving average that shrinks at the ends instead of padding with
+    # zeros, so the first and last days keep their level
+    return pd.Series(values).rolling(SMOOTHING_WINDOW, center=True, min_periods=1).mean().tolist()
+
+
+def _request_batch(client, batch, histories, horizon, user, timeout, refresh, queue_timeout):
+    # Short keys keep the prompt small and avoid echoing product names back
+    keys = {f"p{i}": product for i, product in enumerate(batch, start=1)}
+    prompt = build_forecast_prompt(
+        {key: (product, histories[product]) for key, product in keys.items()}, horizon
+    )
+    future = submit(
+        client, prompt, timeout=timeout, user=user, json_mode=True, refresh=refresh, queue_timeout=queue_timeout
+    )
+    return keys, future
+
+
+def forecast_products(client, histories, horizon=MAX_HORIZON, batch_size=BATCH_SIZE,
+                      max_attempts=MAX_ATTEMPTS, user=None, timeout=DEADLINE_SECONDS,
+                      queue_timeout=None, progress=None, on_batch=None):
+    """
+    Forecast several products with batched, JSON-mode LLM requests.
+
+    histories maps product -> daily sales Series. Products are packed
+    batch_size per request. At most as many batches as the admission
+    controller runs at once are in flight, so the rest are only submitted
+    as it frees up, paced by its rate limit. Each product's answer is
+    validated and repaired on its own; only products whose answer is
+    missing or unusable are retried, bypassing the response cache.
+
+    timeout bounds each batch's request; with queue_timeout, the wait for
+    admission is budgeted separately and does not eat into it. progress,
+    if given, is called with the fraction of products settled (forecast,
+    or failed for good); on_batch with each batch's {product: forecast}.
+    Returns ({product: forecast}, [failed products]).
+    """
+    results = {}
+    pending = list(histories)
+    settled = 0
+    for attempt in range(max_attempts):
+        if not pending:
+            break
+        last_attempt = attempt == max_attempts - 1
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        failed = []
+        in_flight = deque()
+
+        def collect(keys, future):
+            nonlocal settled
+            try:
+                answer = _extract_json(future.result())
+            except Exception:
+                answer = {}
+            if not isinstance(answer, dict):
+                answer = {}
+            answered = {}
+            for key, product in keys.items():
+                values = repair_series(answer.get(key, answer.get(str(product))), horizon)
+                if values is None:
+                    failed.append(product)
+                    settled += last_attempt
+                else:
+                    answered[product] = stabilize(values, histories[product])
+                    settled += 1
+            results.update(answered)
+            if on_batch and answered:
+                on_batch(answered)
+            if progress:
+                progress(settled / len(histories))
+
+        for batch in batches:
+            if len(in_flight) >= admission.max_concurrent:
+                collect(*in_flight.popleft())
+            in_flight.append(
+                _request_batch(client, batch, histories, horizon, user, timeout, attempt > 0, queue_timeout)
+            )
+        while in_flight:
+            collect(*in_flight.popleft())
+        pending = failed
+    return results, pending
+
+
+def _forecast_and_store(client, histories, horizon, user, timeout, dataset_key):
+    results, failed = forecast_products(client, histories, horizon, user=user, timeout=timeout)
+    if dataset_key is not None and results:
+        save_forecasts(dataset_key, ENGINE_VERSION, results)
+    return results, failed
+
+
+def start_forecast_products(client, histories, horizon=MAX_HORIZON, user=None, timeout=DEADLINE_SECONDS,
+                            dataset_key=None):
+    """
+    Run forecast_products in the background and return its Future.
+    With dataset_key, results are stored as soon as they arrive, so an answer
+    that comes after the page stopped waiting still serves the next request.
+    """
+    return _executor.submit(_forecast_and_store, client, histories, horizon, user, timeout, dataset_key)
+
+
+class ForecastJob:
+    """A background whole-catalogue forecast run and its progress, for pages to poll."""
+
+    def __init__(self, total):
+        self.total = total
+        self.fraction = 0.0
+        self.future = None
+
+    def report(self, fraction):
+        self.fraction = fraction
+
+    def done(self):
+        return self.future.done()
+
+    def result(self):
+        """({product: forecast}, [failed products]); raises the run's error."""
+        return self.future.result()
+
+
+def _run_job(client, histories, horizon, user, dataset_key, job):
+    # Each batch is stored as it lands, so a long run is usable while it goes
+    return forecast_products(
+        client, histories, horizon, user=user, queue_timeout=QUEUE_SECONDS, progress=job.report,
+        on_batch=lambda answered: save_forecasts(dataset_key, ENGINE_VERSION, answered),
+    )
+
+
+def start_forecast_job(client, histories, dataset_key, horizon=MAX_HORIZON, user=None):
+    """
+    Forecast every product in histories in the background, storing results
+    under dataset_key, and return the ForecastJob. A run already going for
+    the dataset is returned instead of starting another. Batches are paced
+    by the admission controller and each gets its full request budget
+    whatever its time in the queue, so catalogues of thousands of products
+    finish instead of timing out while queued.
+    """
+    with _jobs_lock:
+        job = _jobs.get(dataset_key)
+        if job is None or job.done():
+            job = ForecastJob(len(histories))
+            job.future = _executor.submit(_run_job, client, histories, horizon, user, dataset_key, job)
+            _jobs[dataset_key] = job
+    return job
+
+
+def get_forecast_job(dataset_key):
+    """The latest ForecastJob started for a dataset, or None."""
+    with _jobs_lock:
+        return _jobs.get(dataset_key)
@@ -0,0 +1,167 @@
+"""
+Local stand-in for the Groq chat completions endpoint, for measuring
+latency behaviour without network access or API cost.
+
+    python llm_mock.py --port 8008 --latency 2 --rate-limit 5
+    GROQ_BASE_URL=http://127.0.0.1:8008 GROQ_API_KEY=mock streamlit run Home.py
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+TOKEN_INTERVAL = 0.02  # seconds between streamed chunks after the first
+
+
+def _reply_for(prompt):
+    # Forecast prompts ask for a JSON object mapping product keys to N numbers
+    keys = re.search(r"mapping each product key \(([^)]*)\)", prompt)
+    horizon = re.search(r"list of exactly (\d+) numbers", prompt)
+    if keys and horizon:
+        values = [100.0] * int(horizon.group(1))
+        return json.dumps({key.strip(): values for key in keys.group(1).split(",")})
+    return "- Keep inventory aligned with demand\n- Hold prices steady\n- Promote top sellers"
+
+
+class MockServer(ThreadingHTTPServer):
+    """
+    Tracks request counts and, with rate_limit set, answers 429 to requests
+    beyond rate_limit per rolling second, like the real API under load.
+    """
+
+    def __init__(self, address, handler, rate_limit=None):
+        super().__init__(address, handler)
+        self.rate_limit = rate_limit
+        self.stats = {"requests": 0, "rate_limited": 0, "max_in_flight": 0}
+        self._in_flight = 0
+        self._recent = []
+        self._lock = threading.Lock()
+
+    def admit(self):
+        with self._lock:
+            now = time.monotonic()
+            self.stats["requests"] += 1
+            self._recent = [t for t in self._recent if now - t < 1.0]
+            if self.rate_limit is not None and len(self._recent) >= self.rate_limit:
+                self.stats["rate_limited"] += 1
+                return False
+            self._recent.append(now)
+            self._in_flight += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self._in_flight)
+            return True
+
+    def done(self):
+        with self._lock:
+            self._in_flight -= 1
+
+
+def _make_handler(latency):
+    class MockCompletionsHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload, headers=()):
+            payload = json.dumps(payload).encode()
+            try:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # client gave up at its deadline
+
+        def _send_stream(self, model, text):
+            # Server-sent events in the chat.completion.chunk format, one word per chunk
+            pieces = [word + " " for word in text.split(" ")]
+            chunks = [{"content": piece} for piece in pieces] + [{}]
+            try:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                for i, delta in enumerate(chunks):
+                    if i:
+                        time.sleep(TOKEN_INTERVAL)
+                    event = {
+                        "id": "mock-completion",
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [{
+                            "index": 0,
+                            "delta": delta,
+                            "finish_reason": None if delta else "stop",
+                        }],
+                    }
+                    self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def do_POST(self):
+            if not self.path.endswith("/chat/completions"):
+                self.send_error(404)
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            prompt = body.get("messages", [{}])[-1].get("content", "")
+
+            if not self.server.admit():
+                self._send_json(
+                    429,
+                    {"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}},
+                    headers=[("retry-after", "1")],
+                )
+                return
+            try:
+                # latency is the time to the first token
+                time.sleep(latency)
+                if body.get("stream"):
+                    self._send_stream(body.get("model", "mock"), _reply_for(prompt))
+                    return
+            finally:
+                self.server.done()
+
+            self._send_json(200, {
+                "id": "mock-completion",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "mock"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": _reply_for(prompt)},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+
+        def log_message(self, format, *args):
+            pass
+
+    return MockCompletionsHandler
+
+
+def start_mock_server(port=0, latency=1.0, rate_limit=None):
+    """
+    Serve mock completions from a background thread, each delayed by latency
+    seconds and limited to rate_limit requests per second if given.
+    Returns (server, base_url); server.stats has the counters and
+    server.shutdown() stops it.
+    """
+    server = MockServer(("127.0.0.1", port), _make_handler(latency), rate_limit)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock Groq chat completions endpoint")
+    parser.add_argument("--port", type=int, default=8008)
+    parser.add_argument("--latency", type=float, default=1.0, help="seconds per response")
+    parser.add_argument("--rate-limit", type=int, default=None, help="requests per second before 429s")
+    args = parser.parse_args()
+
+    server = MockServer(("127.0.0.1", args.port), _make_handler(args.latency), args.rate_limit)
+    print(f"Mock completions on http://127.0.0.1:{args.port} ({args.latency}s latency)")
+    server.serve_forever()
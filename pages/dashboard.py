@@ -3,7 +3,11 @@ import streamlit as st
 import pandas as pd
 import altair as alt
 from pages.data_upload import data_extraction
-from utils import custom_sidebar,require_upload
+from utils import custom_sidebar,require_upload,date_range_filter
+from charts import downsample
+from aggregates import LEVELS, WEEKDAYS, calendar_cells, load_calendar, load_date_index, slice_calendar
+from alerts import load_alerts
+from drilldown import available_dimensions, available_metrics, dimension_values, query
 from auth import is_logged_in
 from auth import logout
 import base64
@@ -135,8 +139,19 @@ if "save_path" not in st.session_state:
         unsafe_allow_html=True
     )
 else:
+    # ---- Date Range ----
+    # Any range is a binary search into the persisted date index
+    try:
+        first_day, last_day = load_date_index(st.session_state.save_path).bounds()
+    except Exception:
+        first_day = last_day = None
+    if first_day is not None:
+        range_start, range_end = date_range_filter(first_day, last_day, key="dashboard_range")
+    else:
+        range_start = range_end = None
+
     # ---- Extract metrics ----
-    metrics = data_extraction(st.session_state.save_path)
+    metrics = data_extraction(st.session_state.save_path, range_start, range_end)
 
     if "error" in metrics:
         st.error(metrics["error"])
@@ -148,6 +163,30 @@ else:
         col3.metric("Latest Sales", f"${metrics['latest_sales']:,.0f}")
         col4.metric("Growth Rate", f"{metrics['growth']:+.2f}%")
 
+        # ---- Profitability KPI Cards (when the data has Cost / Profit / Units) ----
+        profitability = [
+            ("Total Cost", f"${metrics['total_cost']:,.0f}" if "total_cost" in metrics else None),
+            ("Total Profit", f"${metrics['total_profit']:,.0f}" if "total_profit" in metrics else None),
+            ("Profit Margin", f"{metrics['margin']:.1f}%" if "margin" in metrics else None),
+            ("Units Sold", f"{metrics['total_units']:,.0f}" if "total_units" in metrics else None),
+        ]
+        profitability = [(label, value) for label, value in profitability if value is not None]
+        if profitability:
+            for col, (label, value) in zip(st.columns(4), profitability):
+                col.metric(label, value)
+
+        # ---- Trend Alerts ----
+        # Computed for every product when the data was uploaded; read back as is
+        alerts = load_alerts(st.session_state.save_path)
+        if not alerts.empty:
+            with st.expander(f"🔔 Trend Alerts ({len(alerts)})", expanded=True):
+                st.caption(f"Latest {alerts['Date'].max():%b %d, %Y} data, most significant first")
+                for _, alert in alerts.head(10).iterrows():
+                    icon = "📉" if alert['Value'] < 0 else "📈"
+                    st.write(f"{icon} **{alert['Alert']}** — {alert['Message']}")
+                if len(alerts) > 10:
+                    st.caption(f"…and {len(alerts) - 10} more")
+
         st.markdown("---")
 
         # ---- Layout: Sales Trend & Top Products ----
@@ -157,7 +196,7 @@ else:
             st.subheader("📈 Sales Trend (Last 12 Months)")
             if metrics.get("sales_trend") is not None and not metrics["sales_trend"].empty:
                 df_trend = metrics["sales_trend"].copy()
-                df_trend['Month'] = pd.to_datetime(df_trend['Date']).dt.to_period('M').dt.to_timestamp()
+                df_trend['Month'] = df_trend['Date'].dt.to_period('M').dt.to_timestamp()
 
                 chart = alt.Chart(df_trend).mark_line(point=True).encode(
                     x=alt.X('Month:T', title="Month"),
@@ -174,27 +213,105 @@ else:
             st.subheader("🏆 Top Products")
             if metrics.get("top_products") is not None and not metrics["top_products"].empty:
                 for _, row in metrics["top_products"].iterrows():
-                    st.write(f"**{row['Product']}** — ${row['Sales']:,.0f}")
+                    line = f"**{row['Product']}** — ${row['Sales']:,.0f}"
+                    if "Margin" in row and pd.notna(row["Margin"]):
+                        line += f" · {row['Margin']:.1f}% margin"
+                    st.write(line)
             else:
                 st.info("No 'Product' column found for ranking.")
 
         st.markdown("---")
 
-        # # ---- Optional: Monthly Sales Heatmap ----
-        if metrics.get("sales_trend") is not None and not metrics["sales_trend"].empty:
-            st.subheader("🗓 Monthly Sales Heatmap")
-            df_heatmap = metrics["sales_trend"].copy()
-            df_heatmap['Month'] = pd.to_datetime(df_heatmap['Date']).dt.to_period('M').dt.to_timestamp()
-            df_heatmap['Day'] = pd.to_datetime(df_heatmap['Date']).dt.day
-
-            heatmap = alt.Chart(df_heatmap).mark_rect().encode(
-                x=alt.X('Day:O', title="Day of Month"),
-                y=alt.Y('Month:T', title="Month"),
-                color=alt.Color('Sales:Q', scale=alt.Scale(scheme='greens'), title='Sales ($)'),
-                tooltip=[
-                    alt.Tooltip('Date:T', title='Date'),
-                    alt.Tooltip('Sales:Q', title='Sales', format='$,.0f')
-                ]
-            ).properties(height=400)
-
-            st.altair_chart(heatmap, use_container_width=True)
+        # ---- Daily Sales Heatmaps ----
+        # Served from calendar grids binned at upload: at most 12 x 31 cells
+        # per year, however many transactions feed them
+        calendar = slice_calendar(load_calendar(st.session_state.save_path), range_start, range_end)
+        if len(calendar["month"]):
+            st.subheader("🗓 Daily Sales Heatmap")
+            month_tab, week_tab = st.tabs(["Day of Month", "Day of Week"])
+
+            with month_tab:
+                heatmap = alt.Chart(calendar_cells(calendar, "month")).mark_rect().encode(
+                    x=alt.X('Day:O', title="Day of Month"),
+                    y=alt.Y('yearmonth(Month):O', title="Month"),
+                    color=alt.Color('Sales:Q', scale=alt.Scale(scheme='greens'), title='Sales ($)'),
+                    tooltip=[
+                        alt.Tooltip('yearmonth(Month):O', title='Month'),
+                        alt.Tooltip('Day:O', title='Day'),
+                        alt.Tooltip('Sales:Q', title='Sales', format='$,.0f')
+                    ]
+                ).properties(height=400)
+                st.altair_chart(heatmap, use_container_width=True)
+
+            with week_tab:
+                heatmap = alt.Chart(calendar_cells(calendar, "week")).mark_rect().encode(
+                    x=alt.X('yearmonthdate(Week):O', title="Week Starting", axis=alt.Axis(labelOverlap=True)),
+                    y=alt.Y('Weekday:O', title=None, sort=WEEKDAYS),
+                    color=alt.Color('Sales:Q', scale=alt.Scale(scheme='greens'), title='Sales ($)'),
+                    tooltip=[
+                        alt.Tooltip('yearmonthdate(Week):O', title='Week of'),
+                        alt.Tooltip('Weekday:O', title='Day'),
+                        alt.Tooltip('Sales:Q', title='Sales', format='$,.0f')
+                    ]
+                ).properties(height=220)
+                st.altair_chart(heatmap, use_container_width=True)
+
+        # ---- Drill-down ----
+        # Answered from the pre-aggregated cubes; repeated picks are memoized
+        dims = available_dimensions(st.session_state.save_path)
+        if dims:
+            st.markdown("---")
+            st.subheader("🔎 Drill-down")
+            c1, c2, c3, c4 = st.columns(4)
+            group_dim = c1.selectbox("Break down by", dims)
+            metric = c2.selectbox("Metric", available_metrics(st.session_state.save_path))
+            grain = c3.selectbox("Time grain", list(LEVELS), index=list(LEVELS).index('month'))
+            filter_dim = c4.selectbox("Filter by", ["None"] + [dim for dim in dims if dim != group_dim])
+
+            filters = {}
+            if filter_dim != "None":
+                picked = st.multiselect(
+                    f"{filter_dim} values", dimension_values(st.session_state.save_path, filter_dim)
+                )
+                if picked:
+                    filters[filter_dim] = picked
+
+            try:
+                totals = query(st.session_state.save_path, filters, [group_dim], metric,
+                               start=range_start, end=range_end)
+                series = query(st.session_state.save_path, filters, [group_dim], metric, grain,
+                               start=range_start, end=range_end)
+            except ValueError as e:
+                st.error(f"❌ {e}")
+            else:
+                # Charts keep the 10 largest groups readable
+                top = totals.sort_values(metric, ascending=False).head(10)
+                series = series[series[group_dim].isin(top[group_dim])]
+                # Day and week grains grow with the date range; each group's
+                # line is capped at MAX_POINTS, keeping its peaks
+                series = downsample(series, 'Date', metric, by=group_dim)
+
+                bar_col, line_col = st.columns((1, 2))
+                with bar_col:
+                    bars = alt.Chart(top).mark_bar().encode(
+                        x=alt.X(f'{metric}:Q', title=metric),
+                        y=alt.Y(f'{group_dim}:N', sort='-x', title=None),
+                        tooltip=[
+                            alt.Tooltip(f'{group_dim}:N'),
+                            alt.Tooltip(f'{metric}:Q', format=',.2f')
+                        ]
+                    ).properties(height=350)
+                    st.altair_chart(bars, use_container_width=True)
+                with line_col:
+                    # Point markers only while periods are few enough to tell apart
+                    lines = alt.Chart(series).mark_line(point=series['Date'].nunique() <= 60).encode(
+                        x=alt.X('Date:T', title=grain.capitalize()),
+                        y=alt.Y(f'{metric}:Q', title=metric),
+                        color=alt.Color(f'{group_dim}:N'),
+                        tooltip=[
+                            alt.Tooltip('Date:T', title=grain.capitalize()),
+                            alt.Tooltip(f'{group_dim}:N'),
+                            alt.Tooltip(f'{metric}:Q', format=',.2f')
+                        ]
+                    ).properties(height=350)
+                    st.altair_chart(lines, use_container_width=True)
@@ -1,12 +1,14 @@
 import streamlit as st
-import os
 import time
 import json
-import pandas as pd
 from utils import custom_sidebar
 from auth import is_logged_in
+from ingest import ingest_uploads, file_fingerprint
+from alerts import build_alerts
+from aggregates import build_calendar, build_date_index, build_rollup, dataset_metrics, load_date_index, load_rollup
+from forecasting import start_batch_forecast
+from cache import metrics_cache
 import base64
-import os
 from auth import logout
 
 st.markdown("""
@@ -120,63 +122,39 @@ if not is_logged_in():
 
 
 
-def data_extraction(file_path):
+def data_extraction(file_path, start=None, end=None):
+    """
+    Dashboard metrics for a dataset, optionally limited to the dates in
+    [start, end]. Memoized process-wide by file fingerprint and range so
+    repeated renders across sessions are a cache lookup.
+    """
     try:
-        df = pd.read_csv(file_path)
+        key = ("data_extraction", file_fingerprint(file_path), start, end)
     except FileNotFoundError:
         return {"error": "File not found"}
     except Exception as e:
         return {"error": f"Error reading file: {e}"}
 
-    # Validate required columns
-    required_cols = ['Sales', 'Date']
-    for col in required_cols:
-        if col not in df.columns:
-            return {"error": f"Missing required column: {col}"}
-
-    # Clean and sort data
-    df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-    df = df.dropna(subset=['Date', 'Sales']).sort_values('Date')
-
-    # Compute KPIs
-    total_sales = df['Sales'].sum()
-    avg_sales = df['Sales'].mean()
-    latest_sales = df['Sales'].iloc[-1] if len(df) > 0 else 0
-    growth = ((df['Sales'].iloc[-1] - df['Sales'].iloc[-2]) / df['Sales'].iloc[-2] * 100) if len(df) > 1 else 0
-
-    # Sales trend over time (monthly aggregation)
-    sales_trend = (
-        df.groupby(df['Date'].dt.to_period('M'))['Sales']
-        .sum()
-        .reset_index()
-        .sort_values('Date')
+    return metrics_cache.get_or_compute(
+        key,
+        lambda: _compute_metrics(file_path, start, end),
+        should_cache=lambda metrics: "error" not in metrics,
     )
-    sales_trend['Date'] = sales_trend['Date'].dt.to_timestamp()
-
-    # Top products by sales (if Product column exists)
-    if 'Product' in df.columns:
-        top_products = (
-            df.groupby('Product')['Sales']
-            .sum()
-            .sort_values(ascending=False)
-            .head(5)
-            .reset_index()
-        )
-    else:
-        top_products = None
-
-    metrics = {
-        "total_sales": round(total_sales, 2),
-        "avg_sales": round(avg_sales, 2),
-        "latest_sales": round(latest_sales, 2),
-        "growth": round(growth, 2),
-        "sales_trend": sales_trend,
-        "top_products": top_products
-    }
 
+
+def _compute_metrics(file_path, start=None, end=None):
+    # KPIs come from the date index and the daily rollup cube built at
+    # upload, not the raw rows
+    try:
+        metrics = dataset_metrics(load_rollup(file_path), load_date_index(file_path), start, end)
+    except FileNotFoundError:
+        return {"error": "File not found"}
+    except ValueError as e:
+        return {"error": str(e)}
+    except Exception as e:
+        return {"error": f"Error reading file: {e}"}
     return metrics
 
-    
 
 st.title("📤 Upload Sale Data")
 
@@ -221,15 +199,39 @@ if "file_status" not in st.session_state:
 
 
 if uploaded_files:
-    os.makedirs("tmp", exist_ok=True)
-    for uploaded_file in uploaded_files:
-        file_name = uploaded_file.name
-        save_path = os.path.join("tmp", file_name)
-        with open(save_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
+    uploads = [(uploaded_file.name, uploaded_file.getbuffer()) for uploaded_file in uploaded_files]
+
+    # Files are parsed in parallel into the columnar cache and merged into
+    # one de-duplicated dataset; pages load the merged copy
+    progress_bar = st.progress(0.0)
+
+    def report_progress(file_name, fraction):
+        progress_bar.progress(fraction, text=f"⏳ Processing {file_name}...")
+
+    save_path, errors = ingest_uploads(uploads, progress=report_progress)
+    progress_bar.empty()
+
+    for file_name, _ in uploads:
+        if file_name in errors:
+            st.session_state.file_status[file_name] = f"Error reading file: {errors[file_name]}"
+        else:
+            st.session_state.file_status[file_name] = "✅ Completed"
 
+    if save_path:
+        # Stored forecasts are keyed by content hash, so the new dataset never
+        # reads the previous one's; those stay for other sessions still using it
         st.session_state.save_path = save_path  # ✅ Store string only
-        st.session_state.file_status[file_name] = "✅ Completed"
+        # Daily cubes, calendar grids, date index and trend alerts that the pages query
+        try:
+            build_rollup(save_path)
+            build_calendar(save_path)
+            build_date_index(save_path)
+            build_alerts(save_path)
+        except ValueError as e:
+            st.error(f"❌ {e}")
+        # Forecast every product in the background so the forecasting page
+        # can serve results without computing them on click
+        start_batch_forecast(save_path)
 
 
 st.subheader("Uploaded Files")
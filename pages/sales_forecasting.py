@@ -3,16 +3,20 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import openai
-import os
-from dotenv import load_dotenv
-from groq import Groq
 import altair as alt
-import numpy as np
-from datetime import datetime, timedelta
+from datetime import timedelta
 from auth import is_logged_in
-from utils import custom_sidebar,require_upload
+from utils import custom_sidebar,require_upload,wait_with_queue_status,date_range_filter
+from aggregates import load_date_index, load_rollup, products_of, slice_cube
+from forecasting import daily_series, holt_winters, product_matrix, start_batch_forecast, MAX_HORIZON, ENGINE_VERSION
+from ingest import dataset_id
+from db import get_forecast, save_forecasts
+from prompts import build_recommendation_prompt
+from llm_forecasting import get_forecast_job, start_forecast_job, start_forecast_products, ENGINE_VERSION as LLM_ENGINE_VERSION, MAX_ATTEMPTS as LLM_MAX_ATTEMPTS
+from llm import get_client, stream, queue_position, DEADLINE_SECONDS, SLO_SECONDS
+from recommendations import rule_based_recommendations
 import base64
-import os
+import time
 from auth import logout
 
 st.set_page_config(page_title="SalesSight - Dashboard", layout="wide")
@@ -124,26 +128,37 @@ if not is_logged_in():
 
 
 
-# ---- Load CSV ----
+# ---- Load Dataset ----
 if "save_path" not in st.session_state:
     st.warning("Please upload a CSV file first.")
     st.stop()
 
 file_path = st.session_state.save_path
-df = pd.read_csv(file_path)
+# Pages query the daily (date x product) rollup cube, not the raw rows
+try:
+    cube = load_rollup(file_path)
+except ValueError:
+    st.error("❌ Your CSV must include 'Date' and 'Sales' columns.")
+    st.stop()
+# Stored forecasts are keyed by content hash, so new data never hits old ones
+forecast_key = dataset_id(file_path)
 
-# ---- Summaries ----
-product_summary = df.groupby('Product')['Sales'].sum().reset_index()
-data_str = product_summary.to_csv(index=False)
+# Normally already queued right after upload; this covers a restarted server
+start_batch_forecast(file_path)
 
-# ---- Load Environment Variables ----
-load_dotenv()
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-if not GROQ_API_KEY:
-    st.error("❌ GROQ_API_KEY is not set in your environment variables.")
-    st.stop()
+# Every product is forecast over the dataset-wide date range
+data_start, data_end = load_date_index(file_path).bounds()
+
+# ---- Shared LLM Client ----
+# Built once per process; None when GROQ_API_KEY is not set. The statistical
+# engine runs locally; the LLM is only needed for the AI engine and for
+# narrative recommendations
+client = get_client()
+llm_user = st.session_state.get("email")
 
-client = Groq(api_key=GROQ_API_KEY)
+STATISTICAL_ENGINE = "Statistical (Holt-Winters)"
+LLM_ENGINE = "AI (Llama 3.3 via Groq)"
+FORECAST_ENGINES = [STATISTICAL_ENGINE, LLM_ENGINE]
 
 st.title("Sales Forecasting Dashboard")
 
@@ -285,35 +300,68 @@ with left_col:
 
     st.markdown("<strong>Forecast Target</strong>", unsafe_allow_html=True)
     
-    if 'Product' in df.columns:
-        products = ['All Products'] + sorted(df['Product'].dropna().unique().tolist())
-    else:
-        products = ['All Products']
+    products = ['All Products'] + products_of(cube)
 
     product = st.selectbox("", products)
 
+    st.markdown("<strong>History Range</strong>", unsafe_allow_html=True)
+    if data_start is not None:
+        range_start, range_end = date_range_filter(
+            data_start, data_end, key="forecast_range", label_visibility="collapsed"
+        )
+    else:
+        range_start, range_end = data_start, data_end
+
+    st.markdown("<strong>Forecast Engine</strong>", unsafe_allow_html=True)
+    engine = st.selectbox("Forecast Engine", FORECAST_ENGINES, index=0, label_visibility="collapsed")
+
     generate_btn = st.button("🔮 Generate Forecast")
 
+    # SKU-level planning: every product in batched requests, stored for later views
+    if engine == LLM_ENGINE and 'Product' in cube.columns and data_start is not None:
+        if st.button("🤖 Forecast all products with AI"):
+            if client is None:
+                st.error("❌ GROQ_API_KEY is not set in your environment variables.")
+            else:
+                names, dates, matrix = product_matrix(cube, data_start, data_end)
+                histories = {name: pd.Series(row, index=dates) for name, row in zip(names, matrix)}
+                # Runs in the background, paced by the shared request queue
+                start_forecast_job(client, histories, forecast_key, MAX_HORIZON, user=llm_user)
+
+        catalogue_job = get_forecast_job(forecast_key)
+        if catalogue_job is not None and not catalogue_job.done():
+            @st.fragment(run_every=1)
+            def catalogue_progress():
+                if catalogue_job.done():
+                    st.rerun()
+                st.progress(
+                    catalogue_job.fraction,
+                    text=f"🤖 Forecasting {catalogue_job.total} products with AI... results are stored as they arrive",
+                )
+            catalogue_progress()
+        elif catalogue_job is not None:
+            try:
+                results, failed = catalogue_job.result()
+                st.success(f"✅ Stored AI forecasts for {len(results)} of {catalogue_job.total} products.")
+                if failed:
+                    shown = ', '.join(map(str, failed[:20]))
+                    more = f" and {len(failed) - 20} more" if len(failed) > 20 else ""
+                    st.warning(f"⚠️ No usable forecast for: {shown}{more}")
+            except Exception as e:
+                st.error(f"❌ Error generating forecasts: {e}")
+
     if generate_btn:
 
-        if 'Date' not in df.columns or 'Sales' not in df.columns:
-            st.error("❌ Your CSV must include 'Date' and 'Sales' columns.")
-            st.stop()
+        # The cube is sorted by date, so the range is a binary-search slice
+        cube = slice_cube(cube, range_start, range_end)
 
-        if product != "All Products" and 'Product' in df.columns:
-            df = df[df['Product'] == product]
+        if product != "All Products" and 'Product' in cube.columns:
+            cube = cube[cube['Product'] == product]
 
-            if df.empty:
+            if cube.empty:
                 st.warning(f"⚠️ No sales data found for '{product}'. Please select another product.")
                 st.stop()
 
-        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-        df = df.dropna(subset=['Date', 'Sales']).sort_values('Date')
-
-        actual_df = df.tail(30)
-        rng_actual = actual_df['Date']
-        actual = actual_df['Sales'].values
-
 
 
 with right_col:
@@ -322,139 +370,170 @@ with right_col:
 
     if generate_btn:
 
-        
-        if 'Date' not in df.columns or 'Sales' not in df.columns:
-            st.error("❌ Your CSV must include 'Date' and 'Sales' columns.")
+        # Daily totals, so the chart and both engines see one point per day
+        daily = daily_series(cube, range_start, range_end)
+        if daily.empty:
+            st.warning("⚠️ No valid dated sales rows to forecast from.")
             st.stop()
 
-        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-        df = df.dropna(subset=['Date', 'Sales']).sort_values('Date')
-
-        products = ['All Products'] + sorted(df['Product'].unique()) if 'Product' in df.columns else ['All Products']
-
-        actual_df = df.tail(30)
-        rng_actual = actual_df['Date']
-        actual = actual_df['Sales'].values
+        actual_df = daily.tail(30)
+        rng_actual = actual_df.index
+        actual = actual_df.values
 
 
         forecast_days = int(main_label.split()[0])
-        rng_forecast = pd.date_range(start=datetime.today() + timedelta(days=1), periods=forecast_days)
-
-        prompt = f"""
-        You are a sales forecasting assistant.
-        Given the past {forecast_days} days of sales data:
-        {actual.tolist()}
-
-        Forecast the next {forecast_days} days of sales as a Python list of {forecast_days} numeric values.
-
-        Rules:
-        - Base your forecast on the dataset (increasing, decreasing, or stable).
-        - No flattening or constraining unless extreme outliers are present.
-
-        Then, in 2 sentences, explain the likely trend (rising, falling, or stable).
-        Respond in this exact format:
-        [forecast_list]
-        Explanation: your_text_here
-        """
-
-        try:
-            response = client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}]
+        rng_forecast = pd.date_range(start=rng_actual[-1] + timedelta(days=1), periods=forecast_days)
+
+        # Stored forecasts are fitted on the full history; a narrower range
+        # is forecast on the fly and not stored
+        store_key = forecast_key if (range_start, range_end) == (data_start, data_end) else None
+
+        def statistical_forecast():
+            # Normally stored by the all-products batch right after upload
+            stored = get_forecast(store_key, product, ENGINE_VERSION, forecast_days) if store_key else None
+            if stored is not None:
+                return stored
+            full_forecast = holt_winters(daily.values, MAX_HORIZON).tolist()
+            if store_key:
+                save_forecasts(store_key, ENGINE_VERSION, {product: full_forecast})
+            return full_forecast[:forecast_days]
+
+        # The longest horizon is computed once and stored; shorter ones are slices.
+        # LLM calls get SLO_SECONDS before a local result is served instead;
+        # late_forecast holds a still-running AI forecast that may replace it
+        late_forecast = None
+        forecast_note = None
+        if engine == STATISTICAL_ENGINE:
+            forecast = statistical_forecast()
+        elif client is None:
+            # Without a key the AI engine falls back to the statistical forecast
+            forecast_note = "⚡ AI forecasts are unavailable (GROQ_API_KEY is not set); showing the statistical forecast instead."
+            forecast = statistical_forecast()
+        else:
+            forecast = get_forecast(store_key, product, LLM_ENGINE_VERSION, forecast_days) if store_key else None
+
+        if forecast is None:
+            # Compact history summary in, validated JSON out; the job stores its
+            # own results, so an answer arriving after we stop waiting is kept
+            forecast_job = start_forecast_products(
+                client, {product: daily}, MAX_HORIZON, user=llm_user, dataset_key=store_key
+            )
+            forecast_deadline = time.monotonic() + DEADLINE_SECONDS * LLM_MAX_ATTEMPTS
+            try:
+                results, _ = wait_with_queue_status(forecast_job, SLO_SECONDS, lambda: queue_position(llm_user))
+                if product not in results:
+                    raise ValueError("the response could not be parsed as a forecast")
+                forecast = results[product][:forecast_days]
+
+            except TimeoutError:
+                late_forecast = forecast_job
+                forecast_note = (
+                    f"⚡ The AI forecast is taking longer than {SLO_SECONDS:.0f}s, "
+                    "so the statistical forecast is shown until it arrives."
+                )
+                forecast = statistical_forecast()
+            except Exception as e:
+                forecast_note = f"⚡ AI forecast unavailable ({e}); showing the statistical forecast instead."
+                forecast = statistical_forecast()
+
+        # Recommendations only need the forecast numbers, so the request goes
+        # out now and runs while the chart below is built and rendered
+        trend_prompt = build_recommendation_prompt(daily, forecast, forecast_days)
+        recommendation_stream = stream(client, trend_prompt, user=llm_user) if client is not None else None
+
+        def forecast_chart(forecast):
+            # ---- Combine actual and forecast ----
+            # For a continuous line, prepend the last actual to forecast
+            df_actual = pd.DataFrame({'date': rng_actual, 'Sales': actual, 'Type': 'Actual'})
+            df_forecast = pd.DataFrame({'date': rng_forecast, 'Sales': forecast, 'Type': 'Forecast'})
+
+            # Add bridge: first forecast point uses last actual value
+            bridge = pd.DataFrame({
+                'date': [df_actual['date'].iloc[-1]],  # last actual date
+                'Sales': [df_actual['Sales'].iloc[-1]], # last actual value
+                'Type': ['Forecast']  # make it part of forecast so dash continues correctly
+            })
+
+            df_forecast = pd.concat([bridge, df_forecast]).reset_index(drop=True)
+            df = pd.concat([df_actual, df_forecast])
+
+            # ---- Chart ----
+            base = alt.Chart(df).encode(
+                x=alt.X('date:T', axis=alt.Axis(title=None, format='%d %b'))
             )
-            forecast_text = response.choices[0].message.content
-            import re, ast
-            forecast = ast.literal_eval(re.findall(r'\[.*\]', forecast_text)[0])
-            
-            last_value = actual[-1]
-            forecast = np.clip(forecast, last_value * 0.7, last_value * 1.3)  # limit growth
-            window = 5
-            forecast = np.convolve(forecast, np.ones(window)/window, mode='same').tolist()
-
-            # Ensure forecast has exact length
-            if len(forecast) != forecast_days:
-                # st.warning(f"⚠️ Groq returned {len(forecast)} values instead of {forecast_days}. Adjusting to match.")
-                if len(forecast) > forecast_days:
-                    forecast = forecast[:forecast_days]
-                else:
-                    forecast += [forecast[-1]] * (forecast_days - len(forecast))
 
-        except Exception as e:
-            st.error(f"❌ Error generating forecast: {e}")
-            forecast = [actual[-1]] * forecast_days
-
-        # ---- Combine actual and forecast ----
-        # For a continuous line, prepend the last actual to forecast
-        df_actual = pd.DataFrame({'date': rng_actual, 'Sales': actual, 'Type': 'Actual'})
-        df_forecast = pd.DataFrame({'date': rng_forecast, 'Sales': forecast, 'Type': 'Forecast'})
-        
-        # Add bridge: first forecast point uses last actual value
-        bridge = pd.DataFrame({
-            'date': [df_actual['date'].iloc[-1]],  # last actual date
-            'Sales': [df_actual['Sales'].iloc[-1]], # last actual value
-            'Type': ['Forecast']  # make it part of forecast so dash continues correctly
-        })
-
-        df_forecast = pd.concat([bridge, df_forecast]).reset_index(drop=True)
-        df = pd.concat([df_actual, df_forecast])
-
-        # ---- Chart ----
-        base = alt.Chart(df).encode(
-            x=alt.X('date:T', axis=alt.Axis(title=None, format='%d %b'))
-        )
+            line = base.mark_line().encode(
+                y='Sales:Q',
+                color=alt.Color(
+                    'Type:N',
+                    scale=alt.Scale(domain=['Actual','Forecast'], range=['#1E61D4','#34C759']),
+                    legend=alt.Legend(title=None, orient='top')
+                ),
+                strokeDash=alt.condition(
+                    alt.datum.Type == 'Forecast',
+                    alt.value([4,2]),  # dashed forecast
+                    alt.value([])      # solid actual
+                )
+            )
 
-        line = base.mark_line().encode(
-            y='Sales:Q',
-            color=alt.Color(
-                'Type:N',
-                scale=alt.Scale(domain=['Actual','Forecast'], range=['#1E61D4','#34C759']),
-                legend=alt.Legend(title=None, orient='top')
-            ),
-            strokeDash=alt.condition(
-                alt.datum.Type == 'Forecast',
-                alt.value([4,2]),  # dashed forecast
-                alt.value([])      # solid actual
+            points_actual_chart = alt.Chart(df_actual).mark_point(filled=True, size=10, color='black').encode(
+                x='date:T', y='Sales:Q'
+            )
+            points_forecast_chart = alt.Chart(df_forecast.iloc[1::3, :] if forecast_days > 30 else df_forecast.iloc[1:, :]).mark_point(filled=True, size=10, color='black').encode(
+                x='date:T', y='Sales:Q'
             )
-        )
 
-        points_actual_chart = alt.Chart(df_actual).mark_point(filled=True, size=10, color='black').encode(
-            x='date:T', y='Sales:Q'
-        )
-        points_forecast_chart = alt.Chart(df_forecast.iloc[1::3, :] if forecast_days > 30 else df_forecast.iloc[1:, :]).mark_point(filled=True, size=10, color='black').encode(
-            x='date:T', y='Sales:Q'
-        )
+            return (line + points_actual_chart + points_forecast_chart).properties(height=320)
 
-        chart = (line + points_actual_chart + points_forecast_chart).properties(height=320)
-        st.altair_chart(chart, use_container_width=True)
-        
-        forecast_text = response.choices[0].message.content
-        forecast = ast.literal_eval(re.findall(r'\[.*\]', forecast_text)[0])
+        chart_slot = st.empty()
+        forecast_note_slot = st.empty()
+        chart_slot.altair_chart(forecast_chart(forecast), use_container_width=True)
+        if forecast_note:
+            forecast_note_slot.info(forecast_note)
 
-        try:
-            trend_prompt = f"""
-            You are a sales analyst. Based on the following sales forecast:
-            {forecast}
-            and recent actual data:
-            {actual.tolist()}
-            
-            Identify the trend (rising, falling, or stable), and provide 3 specific, actionable recommendations 
-            for improving or sustaining sales performance over the next {forecast_days} days.
-            Focus on marketing, inventory, and pricing strategies.
-            Format your response in short, concise phrasing as bullet points.
-            """
-
-            recommendation_response = client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": trend_prompt}]
-            )
+        st.markdown("<h4>✨ Recommended Actions</h4>", unsafe_allow_html=True)
+        recommendation_slot = st.empty()
 
-            recommendations_text = recommendation_response.choices[0].message.content
+        def show_rule_based(note):
+            with recommendation_slot.container():
+                st.caption(note)
+                st.markdown(rule_based_recommendations(daily, forecast, forecast_days))
 
+        # Tokens are rendered as they arrive instead of after the full completion.
+        # Past the SLO, rules-based recommendations are shown until they start
+        try:
+            if recommendation_stream is None:
+                raise RuntimeError("GROQ_API_KEY is not set in your environment variables")
+
+            try:
+                with st.spinner("Generating recommendations..."):
+                    wait_with_queue_status(
+                        recommendation_stream.started, SLO_SECONDS, lambda: queue_position(llm_user)
+                    )
+            except TimeoutError:
+                show_rule_based("⚡ Quick rules-based recommendations; AI recommendations will replace them when ready.")
+                wait_with_queue_status(
+                    recommendation_stream.started, DEADLINE_SECONDS - SLO_SECONDS, lambda: queue_position(llm_user)
+                )
+            with recommendation_slot.container():
+                st.write_stream(recommendation_stream)
+
+        except TimeoutError:
+            show_rule_based(f"⚡ Rules-based recommendations: the AI did not respond within {DEADLINE_SECONDS:.0f}s.")
         except Exception as e:
-            recommendations_text = f"⚠️ Unable to generate recommendations automatically due to error: {e}"
-
-        st.markdown("<h4>✨ Recommended Actions</h4>", unsafe_allow_html=True)
-        st.markdown(recommendations_text)
+            show_rule_based(f"⚡ Rules-based recommendations: AI recommendations are unavailable ({e}).")
+
+        if late_forecast is not None:
+            try:
+                results, _ = wait_with_queue_status(
+                    late_forecast, forecast_deadline - time.monotonic(), lambda: queue_position(llm_user)
+                )
+                if product not in results:
+                    raise ValueError("the response could not be parsed as a forecast")
+                chart_slot.altair_chart(forecast_chart(results[product][:forecast_days]), use_container_width=True)
+                forecast_note_slot.success("✅ The AI forecast arrived and replaced the statistical forecast.")
+            except Exception:
+                forecast_note_slot.info("⚡ The AI forecast did not arrive in time; showing the statistical forecast.")
 
 
     else:
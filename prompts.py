@@ -0,0 +1,165 @@
+import math
+import re
+
+import numpy as np
+import pandas as pd
+
+
+TOKEN_BUDGET = 600        # upper bound for a single-product prompt
+PRODUCT_TOKEN_BUDGET = 400  # added per extra product in a batched prompt
+MAX_POINTS = 24           # downsampled history points before budget trimming
+TREND_WINDOW = 28         # days used for the recent trend slope
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+_TOKEN_PATTERN = re.compile(r"\d+|[A-Za-z]+|[^\sA-Za-z\d]")
+
+
+def estimate_tokens(text):
+    """
+    Conservative token estimate for Llama-style tokenizers: digits count in
+    groups of three, words in groups of four letters, punctuation singly.
+    """
+    tokens = 0
+    for piece in _TOKEN_PATTERN.findall(text):
+        size = 3 if piece[0].isdigit() else 4
+        tokens += math.ceil(len(piece) / size) if piece[0].isalnum() else 1
+    return tokens
+
+
+def round_sig(value, digits=3):
+    """Round to significant figures so large sales values stay short."""
+    value = float(value)
+    if value == 0 or not math.isfinite(value):
+        return 0
+    rounded = round(value, digits - 1 - int(math.floor(math.log10(abs(value)))))
+    return int(rounded) if rounded == int(rounded) else rounded
+
+
+def _downsample(daily, points):
+    # Mean of equal-width buckets, labelled with each bucket's first date
+    buckets = np.array_split(np.arange(len(daily)), min(points, len(daily)))
+    return [
+        (daily.index[bucket[0]].strftime('%Y-%m-%d'), round_sig(daily.iloc[bucket].mean()))
+        for bucket in buckets if len(bucket)
+    ]
+
+
+def summarize_history(daily, points=MAX_POINTS):
+    """
+    Compact, fixed-size features of a daily sales series: aggregates, weekly
+    seasonality profile, recent trend slope and a downsampled curve.
+    """
+    values = daily.to_numpy(dtype='float64')
+    mean = values.mean()
+    recent = values[-TREND_WINDOW:]
+    slope = np.polyfit(np.arange(len(recent)), recent, 1)[0] if len(recent) > 1 else 0.0
+
+    weekday_means = pd.Series(values, index=daily.index).groupby(daily.index.dayofweek).mean()
+    weekly_profile = {
+        WEEKDAYS[day]: round_sig(weekday_means[day] / mean if mean else 0, 2)
+        for day in weekday_means.index
+    }
+
+    return {
+        "days": len(values),
+        "from": daily.index[0].strftime('%Y-%m-%d'),
+        "to": daily.index[-1].strftime('%Y-%m-%d'),
+        "mean": round_sig(mean),
+        "std": round_sig(values.std()),
+        "min": round_sig(values.min()),
+        "max": round_sig(values.max()),
+        "last_7_mean": round_sig(values[-7:].mean()),
+        "prev_7_mean": round_sig(values[-14:-7].mean()) if len(values) >= 14 else None,
+        "trend_per_day": round_sig(slope),
+        "weekly_profile": weekly_profile,
+        "points": _downsample(daily, points),
+    }
+
+
+def summarize_forecast(forecast, recent_mean):
+    values = np.asarray(forecast, dtype='float64')
+    change = (values.mean() - recent_mean) / recent_mean * 100 if recent_mean else 0.0
+    return {
+        "days": len(values),
+        "first": round_sig(values[0]),
+        "last": round_sig(values[-1]),
+        "mean": round_sig(values.mean()),
+        "min": round_sig(values.min()),
+        "max": round_sig(values.max()),
+        "change_vs_last_7_pct": round_sig(change, 2),
+    }
+
+
+def _format_summary(summary):
+    lines = [
+        f"- {summary['days']} days from {summary['from']} to {summary['to']}",
+        f"- daily mean {summary['mean']}, std {summary['std']}, min {summary['min']}, max {summary['max']}",
+        f"- last 7 days mean {summary['last_7_mean']}, previous 7 days mean {summary['prev_7_mean']}",
+        f"- recent trend {summary['trend_per_day']} per day over the last {TREND_WINDOW} days",
+        "- weekday factor vs mean: " + ", ".join(f"{day} {factor}" for day, factor in summary['weekly_profile'].items()),
+        "- history curve (bucket start: mean daily sales): " + ", ".join(f"{date}: {value}" for date, value in summary['points']),
+    ]
+    return "\n".join(lines)
+
+
+def _fit_budget(build, budget):
+    # Halve the downsampled curve until the prompt fits the budget
+    points = MAX_POINTS
+    prompt = build(points)
+    while estimate_tokens(prompt) > budget and points > 1:
+        points //= 2
+        prompt = build(points)
+    return prompt
+
+
+def build_forecast_prompt(histories, horizon, budget=None):
+    """
+    Forecast prompt for one or more products, given {key: (label, daily series)}.
+    The answer is requested as a JSON object {key: [horizon values]}. Prompt
+    size depends on the number of products, never on the length of history.
+    """
+    if budget is None:
+        budget = TOKEN_BUDGET + PRODUCT_TOKEN_BUDGET * (len(histories) - 1)
+    keys = list(histories)
+
+    def build(points):
+        blocks = "\n\n".join(
+            f"Product {key} ({label}):\n{_format_summary(summarize_history(daily, points))}"
+            for key, (label, daily) in histories.items()
+        )
+        return f"""
+        You are a sales forecasting assistant.
+        Summaries of the daily sales history per product:
+        {blocks}
+
+        Forecast the next {horizon} days of sales for each product.
+
+        Rules:
+        - Base each forecast on its product's data (increasing, decreasing, or stable).
+        - Apply the weekday factors to reflect weekly seasonality.
+        - No flattening or constraining unless extreme outliers are present.
+
+        Respond with only a JSON object mapping each product key ({', '.join(keys)})
+        to a list of exactly {horizon} numbers, for example {{"{keys[0]}": [120.5, 118.0, ...]}}.
+        """
+    return _fit_budget(build, budget)
+
+
+def build_recommendation_prompt(daily, forecast, horizon, budget=TOKEN_BUDGET):
+    """Recommendations prompt built from summaries of the history and forecast."""
+    def build(points):
+        history = summarize_history(daily, points)
+        outlook = summarize_forecast(forecast, history['last_7_mean'])
+        return f"""
+        You are a sales analyst. Based on the following sales history:
+        {_format_summary(history)}
+        and the forecast for the next {outlook['days']} days:
+        - starts at {outlook['first']}, ends at {outlook['last']}, mean {outlook['mean']} (min {outlook['min']}, max {outlook['max']})
+        - {outlook['change_vs_last_7_pct']}% vs the last 7 days mean
+
+        Identify the trend (rising, falling, or stable), and provide 3 specific, actionable recommendations
+        for improving or sustaining sales performance over the next {horizon} days.
+        Focus on marketing, inventory, and pricing strategies.
+        Format your response in short, concise phrasing as bullet points.
+        """
+    return _fit_budget(build, budget)
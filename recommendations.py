@@ -0,0 +1,59 @@
+from prompts import summarize_forecast, summarize_history
+
+
+TREND_THRESHOLD_PCT = 5     # forecast vs last week's mean beyond this is a trend
+VOLATILE_CV = 0.5           # std / mean above this is treated as volatile demand
+WEEKDAY_NAMES = {
+    "Mon": "Monday", "Tue": "Tuesday", "Wed": "Wednesday", "Thu": "Thursday",
+    "Fri": "Friday", "Sat": "Saturday", "Sun": "Sunday",
+}
+
+
+def rule_based_recommendations(daily, forecast, horizon):
+    """
+    Markdown bullet recommendations derived locally from the same features
+    the LLM prompt uses, for when the LLM is slow or unavailable.
+    """
+    history = summarize_history(daily)
+    outlook = summarize_forecast(forecast, history['last_7_mean'])
+    change = outlook['change_vs_last_7_pct']
+    mean = history['mean']
+    volatility = history['std'] / mean if mean else 0.0
+
+    profile = history['weekly_profile']
+    peak_day = WEEKDAY_NAMES[max(profile, key=profile.get)] if profile else None
+    low_day = WEEKDAY_NAMES[min(profile, key=profile.get)] if profile else None
+
+    if change >= TREND_THRESHOLD_PCT:
+        trend = "rising"
+        bullets = [
+            f"**Inventory:** raise stock ahead of the expected {change:+.0f}% lift to avoid stock-outs.",
+            "**Pricing:** hold prices and reduce discounting while demand is growing.",
+        ]
+    elif change <= -TREND_THRESHOLD_PCT:
+        trend = "falling"
+        bullets = [
+            f"**Inventory:** scale back reorders in line with the expected {change:+.0f}% drop.",
+            "**Pricing:** test targeted promotions or bundles to recover volume.",
+        ]
+    else:
+        trend = "stable"
+        bullets = [
+            "**Inventory:** keep reorder levels close to the current run rate.",
+            "**Pricing:** trial small price adjustments to grow margin without hurting volume.",
+        ]
+
+    if peak_day and low_day and peak_day != low_day:
+        bullets.append(
+            f"**Marketing:** schedule campaigns around {peak_day}, the strongest day, "
+            f"and use offers to lift {low_day}, the weakest."
+        )
+    else:
+        bullets.append("**Marketing:** keep campaign spend steady and track weekly response.")
+
+    if volatility > VOLATILE_CV:
+        bullets.append("**Inventory:** demand is volatile, so keep extra safety stock.")
+
+    lines = [f"Sales are **{trend}** over the next {horizon} days ({change:+.1f}% vs the last 7 days)."]
+    lines += [f"- {bullet}" for bullet in bullets]
+    return "\n".join(lines)
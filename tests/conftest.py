@@ -0,0 +1,67 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_cwd = os.getcwd()
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: large synthetic datasets; skip with -m 'not slow'")
+    # Uploads and the cache DB are relative to the working directory, so move
+    # to a scratch directory before any test module is collected
+    config._workdir = tempfile.mkdtemp(prefix="sales-tests-")
+    os.chdir(config._workdir)
+
+
+def pytest_unconfigure(config):
+    os.chdir(_cwd)
+    shutil.rmtree(config._workdir, ignore_errors=True)
+
+
+@pytest.fixture
+def sales_dataset():
+    """
+    Factory writing a cached dataset of random sales rows over a catalogue of
+    products, with Cost, Profit and Units when measures is set. Returns
+    (cache path, frame).
+    """
+    # Imported here, after pytest_configure has moved to the scratch directory
+    from ingest import cache_path_for, write_cache
+
+    def make(name, rows, products=500, measures=False, days=3 * 365, seed=0):
+        rng = np.random.default_rng(seed)
+        labels = np.array([f"Product {i:05d}" for i in range(products)], dtype=object)
+        frame = pd.DataFrame({
+            'Date': pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, days, rows), unit='D'),
+            'Product': labels[rng.integers(0, products, rows)],
+            'Sales': rng.gamma(2.0, 50.0, rows),
+        })
+        if measures:
+            frame['Cost'] = frame['Sales'] * rng.uniform(0.4, 0.9, rows)
+            frame['Profit'] = frame['Sales'] - frame['Cost']
+            frame['Units'] = rng.integers(1, 10, rows).astype('float64')
+        cache_path = cache_path_for(name)
+        write_cache([frame], cache_path)
+        return cache_path, frame
+
+    return make
+
+
+@pytest.fixture
+def daily_sales():
+    """Factory for a daily sales Series with a rising trend, weekly cycle and noise."""
+    def make(days=365, level=100.0, seed=0):
+        rng = np.random.default_rng(seed)
+        dates = pd.date_range("2020-01-01", periods=days, freq="D")
+        trend = np.linspace(level, 1.8 * level, days)
+        weekly = 1 + 0.2 * np.sin(2 * np.pi * dates.dayofweek / 7)
+        return pd.Series(trend * weekly + rng.normal(0, 0.1 * level, days), index=dates)
+
+    return make
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from charts import MAX_POINTS, downsample
+
+
+def test_short_series_is_unchanged(daily_sales):
+    df = daily_sales(90).rename_axis('Date').reset_index(name='Sales')
+    assert downsample(df, 'Date', 'Sales') is df
+
+
+def test_long_series_is_capped_and_keeps_peaks(daily_sales):
+    daily = daily_sales(5 * 365)
+    daily.iloc[1000] = 10 * daily.max()
+    df = daily.rename_axis('Date').reset_index(name='Sales')
+    reduced = downsample(df, 'Date', 'Sales')
+    assert len(reduced) == MAX_POINTS
+    assert reduced['Sales'].max() == df['Sales'].max()
+    assert reduced['Date'].iloc[[0, -1]].tolist() == df['Date'].iloc[[0, -1]].tolist()
+
+
+def test_each_group_is_capped_on_its_own(daily_sales):
+    df = pd.concat(
+        daily_sales(5 * 365, seed=seed).rename_axis('Date').reset_index(name='Sales').assign(Region=region)
+        for seed, region in enumerate(["East", "West", "North"])
+    )
+    df = pd.concat([df, pd.DataFrame({'Date': [pd.Timestamp("2020-01-01")], 'Sales': [1.0], 'Region': ["South"]})])
+    reduced = downsample(df, 'Date', 'Sales', by='Region')
+    counts = reduced['Region'].value_counts()
+    assert counts[["East", "West", "North"]].tolist() == [MAX_POINTS] * 3
+    assert counts["South"] == 1
+    assert np.all(reduced.groupby('Region')['Date'].is_monotonic_increasing)
@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+
+from aggregates import load_rollup
+from ingest import ingest_uploads, load_dataset
+
+
+def column_memory(df, column):
+    return df[column].memory_usage(deep=True, index=False)
+
+
+def test_product_loads_as_categorical(sales_dataset):
+    cache_path, _ = sales_dataset("small-products", 10_000, 50)
+    df = load_dataset(cache_path)
+    assert isinstance(df['Product'].dtype, pd.CategoricalDtype)
+    assert len(df['Product'].cat.categories) == 50
+    cube = load_rollup(cache_path)
+    assert cube['Product'].cat.categories.tolist() == sorted(df['Product'].cat.categories)
+
+
+@pytest.mark.slow
+def test_product_memory_report(sales_dataset):
+    df = load_dataset(sales_dataset("memory-report", 5_000_000, 2000)[0])
+    categorical = column_memory(df, 'Product')
+    as_object = column_memory(df.assign(Product=df['Product'].astype(object)), 'Product')
+    print(
+        f"\nProduct column, 5M rows x 2000 products: categorical {categorical / 2**20:.1f} MiB,"
+        f" object {as_object / 2**20:.1f} MiB ({as_object / categorical:.1f}x)"
+    )
+    assert categorical * 4 < as_object
+
+
+def test_header_only_uploads_are_reported_not_merged():
+    header = b"Date,Product,Sales\n"
+    rows = b"Date,Product,Sales\n2024-01-01,Widget,10\n2024-01-02,Widget,12\n"
+
+    path, errors = ingest_uploads([("empty.csv", header), ("also-empty.csv", b"Date,Sales\n")])
+    assert path is None
+    assert set(errors) == {"empty.csv", "also-empty.csv"}
+
+    path, errors = ingest_uploads([("empty.csv", header), ("sales.csv", rows)])
+    assert list(errors) == ["empty.csv"]
+    assert load_dataset(path)['Sales'].tolist() == [10.0, 12.0]
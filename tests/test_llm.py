@@ -0,0 +1,83 @@
+import time
+
+import pytest
+from groq import Groq
+
+import llm
+from llm import AdmissionController, stream, submit
+from llm_forecasting import start_forecast_products
+from llm_mock import start_mock_server
+from prompts import build_recommendation_prompt
+
+
+LATENCY = 1.0  # mock seconds to first token
+
+
+@pytest.fixture
+def mock():
+    server, base_url = start_mock_server(latency=LATENCY)
+    yield server, Groq(api_key="mock", base_url=base_url, max_retries=0)
+    server.shutdown()
+
+
+@pytest.fixture
+def rate_limited_mock():
+    """A fast mock answering 429 beyond 5 requests per second."""
+    server, base_url = start_mock_server(latency=0.05, rate_limit=5)
+    yield server, Groq(api_key="mock", base_url=base_url, max_retries=0)
+    server.shutdown()
+
+
+def test_forecast_and_recommendation_calls_overlap(mock, daily_sales):
+    server, client = mock
+    daily = daily_sales(120)
+    started = time.monotonic()
+    forecast_job = start_forecast_products(client, {"Widget": daily_sales(120, level=200)}, 30)
+    recommendations = stream(client, build_recommendation_prompt(daily, [100.0] * 30, 30))
+    text = "".join(recommendations)
+    results, failed = forecast_job.result(timeout=2 * LATENCY)
+    elapsed = time.monotonic() - started
+
+    assert text and "Widget" in results and not failed
+    assert server.stats["max_in_flight"] == 2
+    assert elapsed < 2 * LATENCY
+
+
+def test_recommendations_overlap_chart_rendering(mock, daily_sales):
+    server, client = mock
+    daily = daily_sales(120, level=300)
+    started = time.monotonic()
+    # As on the forecasting page: the request goes out before the chart is drawn
+    recommendations = stream(client, build_recommendation_prompt(daily, [300.0] * 30, 30))
+    time.sleep(LATENCY)  # chart rendering
+    text = "".join(recommendations)
+    elapsed = time.monotonic() - started
+
+    assert text and server.stats["requests"] == 1
+    assert elapsed < 2 * LATENCY
+
+
+def test_admission_alternates_users_and_paces_requests(rate_limited_mock, monkeypatch):
+    server, client = rate_limited_mock
+    # One call at a time, so completion order is admission order
+    monkeypatch.setattr(llm, "admission", AdmissionController(1, 4.0, 1))
+    order = []
+
+    def send(user, count):
+        futures = [submit(client, f"Admission test: {user} request {i}", user=user) for i in range(count)]
+        for future in futures:
+            future.add_done_callback(lambda _, user=user: order.append(user))
+        return futures
+
+    started = time.monotonic()
+    futures = send("a", 6)
+    time.sleep(0.1)  # b's burst arrives while a's is queued
+    futures += send("b", 2)
+    for future in futures:
+        future.result(timeout=10)
+    elapsed = time.monotonic() - started
+
+    # a's first call was admitted alone; from then on the users take turns
+    assert order == ["a", "a", "b", "a", "b", "a", "a", "a"]
+    assert server.stats["requests"] == 8 and server.stats["rate_limited"] == 0
+    assert (len(order) - 1) / elapsed <= 4.0
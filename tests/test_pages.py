@@ -0,0 +1,47 @@
+import os
+import shutil
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import llm
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_page(path):
+    # Pages link to each other, which AppTest cannot resolve outside the full app
+    import runpy
+
+    import streamlit as st
+    st.page_link = lambda *args, **kwargs: None
+    runpy.run_path(path, run_name="__main__")
+
+
+@pytest.fixture
+def page(sales_dataset):
+    """Factory for a logged-in AppTest of one page, with a small dataset uploaded."""
+    shutil.copy(os.path.join(ROOT, "logo.png"), "logo.png")
+    cache_path, _ = sales_dataset("page", 5_000, products=5, days=200)
+
+    def make(name):
+        at = AppTest.from_function(run_page, args=(os.path.join(ROOT, "pages", name),), default_timeout=60)
+        at.session_state["logged_in"] = True
+        at.session_state["save_path"] = cache_path
+        return at
+
+    return make
+
+
+def test_ai_engine_without_key_falls_back_to_statistical(page, monkeypatch):
+    monkeypatch.delenv("GROQ_API_KEY", raising=False)
+    monkeypatch.setattr(llm, "_client", None)
+    at = page("sales_forecasting.py").run()
+    engine = next(box for box in at.selectbox if box.label == "Forecast Engine")
+    engine.set_value("AI (Llama 3.3 via Groq)").run()
+    next(button for button in at.button if "Generate" in button.label).click().run()
+
+    assert not at.exception and not at.error
+    assert any("AI forecasts are unavailable" in note.value for note in at.info)
+    assert len(at.get("vega_lite_chart")) == 1
@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from prompts import PRODUCT_TOKEN_BUDGET, TOKEN_BUDGET, build_forecast_prompt, build_recommendation_prompt, estimate_tokens
+
+
+@pytest.mark.parametrize("years", [1, 5])
+def test_forecast_prompt_fits_budget(daily_sales, years):
+    prompt = build_forecast_prompt({"p1": ("Widget", daily_sales(365 * years))}, 30)
+    assert estimate_tokens(prompt) <= TOKEN_BUDGET
+
+
+@pytest.mark.parametrize("years", [1, 5])
+def test_batched_forecast_prompt_fits_budget(daily_sales, years):
+    histories = {f"p{i}": (f"Product {i}", daily_sales(365 * years, seed=i)) for i in range(1, 11)}
+    prompt = build_forecast_prompt(histories, 30)
+    assert estimate_tokens(prompt) <= TOKEN_BUDGET + PRODUCT_TOKEN_BUDGET * 9
+
+
+def test_prompt_size_does_not_grow_with_history(daily_sales):
+    short = build_forecast_prompt({"p1": ("Widget", daily_sales(365))}, 30)
+    long = build_forecast_prompt({"p1": ("Widget", daily_sales(5 * 365))}, 30)
+    assert abs(estimate_tokens(long) - estimate_tokens(short)) <= 0.1 * TOKEN_BUDGET
+
+
+@pytest.mark.parametrize("years", [1, 5])
+def test_recommendation_prompt_fits_budget(daily_sales, years):
+    daily = daily_sales(365 * years)
+    forecast = pd.Series(np.full(30, 150.0), index=pd.date_range(daily.index[-1] + pd.Timedelta(days=1), periods=30))
+    assert estimate_tokens(build_recommendation_prompt(daily, forecast, 30)) <= TOKEN_BUDGET
@@ -1,5 +1,7 @@
 import streamlit as st
+import pandas as pd
 import base64
+import time
 
 
 def require_upload():
@@ -11,6 +13,50 @@ def require_upload():
         st.warning("⚠️ Please upload a sales CSV file first on the Upload page to view analytics.")
         st.stop()
 
+def wait_with_queue_status(future, timeout, position):
+    """
+    Wait up to timeout seconds for a background request, showing the
+    position() in the shared request queue while it is waiting.
+    Raises TimeoutError when the deadline passes.
+    """
+    status = st.empty()
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError
+            place = position()
+            if place:
+                status.info(f"⏳ The AI service is busy — you are #{place} in the queue.")
+            else:
+                status.empty()
+            try:
+                return future.result(timeout=min(0.25, remaining))
+            except TimeoutError:
+                # A timeout raised by the request itself is final
+                if future.done():
+                    raise
+    finally:
+        status.empty()
+
+def date_range_filter(first_day, last_day, key="date_range", label_visibility="visible"):
+    """
+    Date range picker bounded by the dataset's first and last day.
+    Returns (start, end) Timestamps; the full range while a pick is incomplete.
+    """
+    picked = st.date_input(
+        "Date range",
+        value=(first_day.date(), last_day.date()),
+        min_value=first_day.date(),
+        max_value=last_day.date(),
+        key=key,
+        label_visibility=label_visibility,
+    )
+    if isinstance(picked, (tuple, list)) and len(picked) == 2:
+        return pd.Timestamp(picked[0]), pd.Timestamp(picked[1])
+    return first_day, last_day
+
 def custom_sidebar(logo_path="logo.png", title="SalesSight"):
     # Hide Streamlit default sidebar navigation
     st.markdown("""